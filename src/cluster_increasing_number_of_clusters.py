@@ -14,19 +14,25 @@ mpl.rcParams['font.size'] = 24 * 3
 
 from vlmc import VLMC
 from distance import FrobeniusNorm, PSTMatching, NegativeLogLikelihood, ACGTContent
-from clustering import AverageLinkClustering, MSTClustering
+from clustering import AverageLinkClustering, MSTClustering, GraphBasedClustering
 import parse_trees_to_json
 from get_signature_metadata import get_metadata_for
 from test_clustering import parse_clustering_method, add_clustering_arguments
 from test_distance_function import parse_distance_method, add_distance_arguments
 
 
-def test_clustering(d, vlmcs, cluster_class):
+def test_clustering(d, vlmcs, cluster_class, processes=1, distance_directory=None):
   metadata = get_metadata_for([vlmc.name for vlmc in vlmcs])
 
   metrics = np.zeros([len(vlmcs), 7], dtype=np.float32)
 
-  clustering = cluster_class(vlmcs, d, metadata)
+  clustering = cluster_class(vlmcs, d, metadata, processes, distance_directory)
+  if isinstance(clustering, GraphBasedClustering) and clustering.has_merge_history():
+    # Every k from one pass over the merges
+    sweep = clustering.sweep(['organism', 'family', 'genus'], 'family')[:len(vlmcs)]
+    metrics[1:] = np.column_stack([sweep[field] for field in sweep.dtype.names])[1:]
+    return metrics
+
   for i in range(len(vlmcs) - 1, 0, -1):
     print(i)
     clustering_metrics = clustering.cluster(i)
@@ -109,7 +115,7 @@ def test(args):
   else:
     name = cluster_class.__name__ + ", " + d.__class__.__name__
 
-  metrics = test_clustering(d, vlmcs, cluster_class)
+  metrics = test_clustering(d, vlmcs, cluster_class, args.processes, args.distance_directory)
 
   try:
     os.stat(out_directory)
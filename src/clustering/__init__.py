@@ -3,7 +3,10 @@ from .mst_clustering import MSTClustering
 from .average_link_clustering import AverageLinkClustering
 from .k_means import KMeans
 from .fuzzy_similarity_clustering import FuzzySimilarityClustering
-from .clustering_metrics import ClusteringMetrics
+from .clustering_metrics import ClusteringMetrics, silhouette_sweep
 from .dendrogram import DendrogramClustering
 from .from_vsearch import FromVsearch
 from .neighbour_joining import NeighbourJoining
+from .condensed_distances import CondensedDistances
+from .distance_store import DistanceStore
+from .util import calculate_distances_within_vlmcs
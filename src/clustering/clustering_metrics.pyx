@@ -1,158 +1,198 @@
 import networkx as nx
 import numpy as np
 cimport numpy as np
-from itertools import product
+import scipy.sparse
+from collections import Counter
+
+from condensed_distances cimport CondensedDistances
+from linkage cimport DisjointSet
+from linkage import DisjointSet
 
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
+INTTYPE = np.int32
+# The silhouettes go through the distances in blocks of rows of at most this many values
+MAX_BLOCK_VALUES = 2**22
+# The silhouette sweep keeps this many candidates for the closest other cluster of every vlmc
+NBR_CLOSEST_CANDIDATES = 16
 
 cdef class ClusteringMetrics(object):
   """
   Class that calculates different metrics given a clustering of vlmcs.
+  The clustering is the cluster label of every vlmc, numbered in order of the first vlmc
+  of each cluster.  The metrics are computed from the label array with array operations,
+  a graph of the clusters is only built when G is asked for.
   """
-  cdef public object G
+  cdef public np.ndarray labels
+  cdef public int nbr_clusters
   cdef public double distance_mean
-  cdef np.ndarray indexed_distances
+  cdef object distances
   cdef public dict metadata
   cdef list vlmcs
   cdef list merge_distances
+  cdef object _G
 
-  def __cinit__(self, G, distance_mean, indexed_distances, vlmcs, metadata, merge_distances):
-    self.G = G  # the clustering of the vlmcs
+  def __cinit__(self, labels, distance_mean, distances, vlmcs, metadata, merge_distances):
+    # Renumber the clusters by their first vlmc
+    _, first_occurrence, labels = np.unique(labels, return_index=True, return_inverse=True)
+    self.labels = np.argsort(np.argsort(first_occurrence))[labels].astype(INTTYPE)
+    self.nbr_clusters = len(first_occurrence)
     self.distance_mean = distance_mean
-    self.indexed_distances = indexed_distances
-    self.metadata = None  # needs to be set after initialization
+    self.distances = distances  # CondensedDistances between the vlmcs
     self.vlmcs = vlmcs
     self.metadata = metadata
     self.merge_distances = merge_distances
+    self._G = None
 
-  cpdef double average_silhouette(self):
-    silhouette = self.silhouette_metric()
+  @property
+  def G(self):
+    """
+      The clustering as a graph, every cluster is a fully connected component.
+    """
+    if self._G is None:
+      self._G = nx.Graph()
+      self._G.add_nodes_from(self.vlmcs)
+      for cluster in self.cluster_indices():
+        for i in cluster:
+          for j in cluster:
+            self._G.add_edge(self.vlmcs[i], self.vlmcs[j], weight=self.distances.distance(i, j))
+    return self._G
+
+  cpdef list cluster_indices(self):
+    """
+      The indices of the vlmcs in every cluster.
+    """
+    order = np.argsort(self.labels, kind='stable')
+    starts = np.searchsorted(self.labels[order], np.arange(self.nbr_clusters + 1))
+    return [order[starts[i]:starts[i + 1]] for i in range(self.nbr_clusters)]
+
+  cpdef list clusters(self):
+    """
+      The vlmcs of every cluster.
+    """
+    return [[self.vlmcs[i] for i in cluster] for cluster in self.cluster_indices()]
 
-    silhouette_values = [s for s in silhouette.values()]
-    return sum(silhouette_values) / len(silhouette_values)
+  cpdef np.ndarray cluster_sizes(self):
+    return np.bincount(self.labels, minlength=self.nbr_clusters)
+
+  cpdef double average_silhouette(self):
+    return float(np.mean(self._silhouette_values()))
 
   cpdef dict silhouette_metric(self):
-    connected_components = list(nx.connected_components(self.G))
-    average_dist_to_own_component = {}
-    min_dist_to_other_component = {}
-
-    for component in connected_components:
-      for v1 in component:
-        minimum_average_distance_to_other_component = np.inf
-        average_dist_to_own_component[
-            v1.name] = self._same_component_average_distance_to_vlmcs(v1, component)
-
-        # calculate distance to other components
-        for other_component in connected_components:
-          if component is other_component:
-            continue
-          average_distance = self._other_component_average_distance_to_vlmcs(v1, other_component)
-          if average_distance < minimum_average_distance_to_other_component:
-            minimum_average_distance_to_other_component = average_distance
-
-        min_dist_to_other_component[v1.name] = minimum_average_distance_to_other_component
-    silhouette = {}
-    for v in self.G.nodes():
-      s_i = ((min_dist_to_other_component[v.name] - average_dist_to_own_component[v.name]) /
-             max(min_dist_to_other_component[v.name], average_dist_to_own_component[v.name]))
-      silhouette[v.name] = s_i
-    return silhouette
-
-  cdef FLOATTYPE_t _same_component_average_distance_to_vlmcs(self, v1, component):
-    total_distance_to_vlmcs = 0
-    for v2 in component:
-      if v1 is v2:
-        continue
-      total_distance_to_vlmcs += self._find_distance_from_vlmc(v1, v2)
-
-    average_internal_distance = 0
-    nbr_other_elements_in_cluster = len(component) - 1
-    if nbr_other_elements_in_cluster == 0:
-      average_internal_distance = 0
-    else:
-      average_internal_distance = total_distance_to_vlmcs / nbr_other_elements_in_cluster
-    return average_internal_distance
+    return {v.name: s for v, s in zip(self.vlmcs, self._silhouette_values())}
 
-  cdef FLOATTYPE_t _other_component_average_distance_to_vlmcs(self, v1, other_component):
-    total_distance_to_vlmcs = 0
-    average_external_distance = 0
+  cdef np.ndarray _silhouette_values(self):
+    """
+      (b - a) / max(a, b) for every vlmc, with a the average distance to the other vlmcs of
+      its cluster (0 for a singleton) and b the smallest average distance to another cluster.
+    """
+    cdef np.ndarray sizes = self.cluster_sizes()
+    cdef np.ndarray distance_sums = self._cluster_distance_sums()
+    cdef np.ndarray own_cluster = np.arange(len(self.vlmcs))
+    with np.errstate(divide='ignore', invalid='ignore'):
+      average_distances = distance_sums / sizes[None, :]
+      own_average = np.where(sizes[self.labels] > 1,
+                             distance_sums[own_cluster, self.labels] / (sizes[self.labels] - 1), 0)
+      average_distances[own_cluster, self.labels] = np.inf
+      other_average = np.min(average_distances, axis=1)
+      return (other_average - own_average) / np.maximum(other_average, own_average)
 
-    for v2 in other_component:
-      total_distance_to_vlmcs += self._find_distance_from_vlmc(v1, v2)
-    average_external_distance = total_distance_to_vlmcs / len(other_component)
-    return average_external_distance
+  cdef np.ndarray _cluster_distance_sums(self):
+    """
+      The sum of the distances from every vlmc to the vlmcs of every cluster, [vlmcs, clusters].
+      The distances are gone through in blocks of rows, so the square matrix is never made.
+    """
+    cdef Py_ssize_t size = len(self.labels)
+    membership = scipy.sparse.csr_matrix(
+        (np.ones(size), (np.arange(size), self.labels)), shape=(size, self.nbr_clusters))
+    distance_sums = np.empty([size, self.nbr_clusters], dtype=np.float64)
+    block_size = max(1, MAX_BLOCK_VALUES // max(size, 1))
+    for start in range(0, size, block_size):
+      end = min(start + block_size, size)
+      distance_sums[start:end] = self.distances.rows(start, end).astype(np.float64) @ membership
+    return distance_sums
 
   cpdef double average_percent_same_taxonomy(self, taxonomy):
-    average = 0
-    connected_components = list(nx.connected_components(self.G))
-    for connected_component in connected_components:
-      average += self.percent_same_taxonomy(connected_component,
-                                            taxonomy) * len(connected_component)
-
-    return average / len(self.vlmcs)
+    """
+      The percent of pairs in the same cluster with the same taxonomy, weighted by cluster size.
+    """
+    contingency_table = self.contingency_table(taxonomy)
+    sizes = contingency_table.sum(axis=1)
+    percent_same_taxonomy = np.sum(contingency_table ** 2, axis=1) / sizes ** 2
+    return float(np.sum(percent_same_taxonomy * sizes) / len(self.vlmcs))
 
   cpdef double percent_same_taxonomy(self, connected_component, taxonomy):
-    size_of_component = len(connected_component)
-    percent_of_same_family = sum(
-        [self._number_in_taxonomy(vlmc, connected_component, taxonomy)
-         for vlmc in connected_component]
-    ) / (size_of_component ** 2)
-    return percent_of_same_family
-
-  cdef int _number_in_taxonomy(self, vlmc, vlmcs, taxonomy):
-    number_of_same_taxonomy = len([other for other in vlmcs
-                                   if self.metadata[other.name][taxonomy] == self.metadata[vlmc.name][taxonomy]])
-    return number_of_same_taxonomy
-
-  cdef FLOATTYPE_t _find_distance_from_vlmc(self, v1, v2):
-    v1_idx = self.vlmcs.index(v1)
-    v2_idx = self.vlmcs.index(v2)
-    return self.indexed_distances[v1_idx, v2_idx]
+    taxonomy_counts = np.array(list(Counter([self.metadata[vlmc.name][taxonomy]
+                                             for vlmc in connected_component]).values()))
+    return np.sum(taxonomy_counts ** 2) / (len(connected_component) ** 2)
 
   cpdef tuple sensitivity_specificity(self, meta_key):
-    true_positives, false_positives = self._count_positives(meta_key)
-    true_negatives, false_negatives = self._count_negatives(meta_key)
+    true_positives, false_positives, true_negatives, false_negatives = self.pair_counts(meta_key)
 
     sensitivity = true_positives / (true_positives + false_negatives)
     precision = true_positives / (true_positives + false_positives)
     specificity = true_negatives / (true_negatives + false_positives)
     return sensitivity, precision
 
-  cdef tuple _count_positives(self, meta_key):
-    cdef int true_positives = 0
-    cdef int false_positives = 0
-    connected_components = nx.connected_components(self.G)
-    for connected_component in connected_components:
-      pairs = product(connected_component, repeat=2)
-      for v1, v2 in pairs:
-        if v1 != v2:
-          if self.metadata[v1.name][meta_key] == self.metadata[v2.name][meta_key]:
-            true_positives += 1
-          else:
-            false_positives += 1
-
-    return true_positives, false_positives
-
-  cdef tuple _count_negatives(self, meta_key):
-    cdef int false_negatives = 0
-    cdef int true_negatives = 0
-    connected_components = list(nx.connected_components(self.G))
-    for connected_component in connected_components:
-      for other_component in connected_components:
-        if connected_component is not other_component:
-          pairs = product(connected_component, other_component)
-          for v1, v2 in pairs:
-            if self.metadata[v1.name][meta_key] == self.metadata[v2.name][meta_key]:
-              false_negatives += 1
-            else:
-              true_negatives += 1
-
-    return true_negatives, false_negatives
+  cpdef double specificity(self, meta_key):
+    true_positives, false_positives, true_negatives, false_negatives = self.pair_counts(meta_key)
+    return true_negatives / (true_negatives + false_positives)
+
+  cpdef tuple pair_counts(self, meta_key):
+    """
+      The ordered pairs of different vlmcs that are (true_positives, false_positives,
+      true_negatives, false_negatives), where positive is in the same cluster and true is
+      the same meta_key.  All come from the sums of squares of the contingency table.
+    """
+    contingency_table = self.contingency_table(meta_key).astype(np.int64)
+    same_cluster_and_taxonomy = int(np.sum(contingency_table ** 2))
+    same_cluster = int(np.sum(contingency_table.sum(axis=1) ** 2))
+    same_taxonomy = int(np.sum(contingency_table.sum(axis=0) ** 2))
+    nbr_vlmcs = len(self.vlmcs)
+
+    true_positives = same_cluster_and_taxonomy - nbr_vlmcs
+    false_positives = same_cluster - same_cluster_and_taxonomy
+    false_negatives = same_taxonomy - same_cluster_and_taxonomy
+    true_negatives = nbr_vlmcs ** 2 - same_cluster - false_negatives
+    return true_positives, false_positives, true_negatives, false_negatives
+
+  cpdef double rand_index(self, meta_key):
+    true_positives, false_positives, true_negatives, false_negatives = self.pair_counts(meta_key)
+    return (true_positives + true_negatives) / (true_positives + false_positives + true_negatives + false_negatives)
+
+  cpdef double adjusted_rand_index(self, meta_key):
+    """
+      The Rand index corrected for chance, by Hubert and Arabie.
+    """
+    contingency_table = self.contingency_table(meta_key).astype(np.int64)
+    same_cluster_and_taxonomy = _pairs(contingency_table)
+    same_cluster = _pairs(contingency_table.sum(axis=1))
+    same_taxonomy = _pairs(contingency_table.sum(axis=0))
+    expected_index = same_cluster * same_taxonomy / _pairs(np.array([len(self.vlmcs)]))
+    max_index = (same_cluster + same_taxonomy) / 2
+    if max_index == expected_index:
+      # Both are a single cluster or all singletons
+      return 1.0
+    return (same_cluster_and_taxonomy - expected_index) / (max_index - expected_index)
+
+  cpdef double fowlkes_mallows_index(self, meta_key):
+    true_positives, false_positives, true_negatives, false_negatives = self.pair_counts(meta_key)
+    if true_positives == 0:
+      return 0.0
+    return true_positives / np.sqrt((true_positives + false_positives) * (true_positives + false_negatives))
+
+  cpdef np.ndarray contingency_table(self, meta_key):
+    """
+      The number of vlmcs with every value of meta_key in every cluster, [clusters, values].
+    """
+    _, taxonomy_labels = np.unique([self.metadata[vlmc.name][meta_key] for vlmc in self.vlmcs],
+                                   return_inverse=True)
+    nbr_taxonomies = np.max(taxonomy_labels) + 1 if len(taxonomy_labels) > 0 else 0
+    return np.bincount(self.labels * nbr_taxonomies + taxonomy_labels,
+                       minlength=self.nbr_clusters * nbr_taxonomies).reshape(self.nbr_clusters, nbr_taxonomies)
 
   cpdef tuple cluster_size_metrics(self):
-    connected_components = nx.connected_components(self.G)
-    sizes = np.array([len(c) for c in connected_components])
+    sizes = self.cluster_sizes()
     return sizes.mean(), np.median(sizes), sizes.min(), sizes.max()
 
   cpdef list get_merge_distances(self):
@@ -165,11 +205,11 @@ cdef class ClusteringMetrics(object):
       return -1
 
   cpdef float average_distance_std(self, distance_function):
-    connected_components = list(nx.connected_components(self.G))
+    clusters = self.clusters()
     sum_of_gc_std = 0
-    for connected_component in connected_components:
+    for cluster in clusters:
       gc_distances = [distance_function.distance(v1, v2)
-                      for v1 in connected_component for v2 in connected_component
+                      for v1 in cluster for v2 in cluster
                       if v1 != v2]
 
       if len(gc_distances) < 1:
@@ -178,6 +218,242 @@ cdef class ClusteringMetrics(object):
         gc_std = np.std(gc_distances)
       sum_of_gc_std += gc_std
 
-    number_of_clusters = len(connected_components)
+    number_of_clusters = len(clusters)
     average_gc = sum_of_gc_std / number_of_clusters
     return average_gc
+
+
+def _pairs(counts):
+  """
+    The number of unordered pairs within each count, summed.
+  """
+  return float(np.sum(counts * (counts - 1) / 2))
+
+
+def silhouette_sweep(CondensedDistances distances, merge_left, merge_right):
+  """
+    The average silhouette for every number of clusters reached by merging, in order,
+    the clusters of merge_left[i] and merge_right[i], starting from singletons.  Entry k
+    of the returned array is the average silhouette with k clusters (NaN if not reached).
+    The sum of the distances from every vlmc to every cluster is kept up to date, so a
+    merge adds one row to another.  For every vlmc, the other clusters with the smallest
+    average distances are kept as candidates for the closest one, and every cluster
+    lists the vlmcs it is a candidate of.  The averages to every other cluster are
+    unchanged by a merge, so it only removes the two merged clusters from the candidates
+    of the vlmcs they list, and offers the merged one instead of the farthest candidate.
+    Only a vlmc left without candidates searches all clusters again.
+  """
+  cdef Py_ssize_t size = distances.size
+  average_silhouettes = np.full(size + 1, np.nan)
+  if size == 0:
+    return average_silhouettes
+
+  cluster_sizes = np.ones(size)
+  alive = np.ones(size, dtype=bool)
+  cluster_of = np.arange(size)
+  members = [np.array([i]) for i in range(size)]
+  own_sums = np.zeros(size)
+
+  # Empty candidates are cluster -1 at an infinite average.  The vlmcs a cluster lists may
+  # since have dropped it, they are checked when the cluster is merged.
+  nbr_candidates = min(NBR_CLOSEST_CANDIDATES, size - 1)
+  candidate_clusters = np.full([size, nbr_candidates], -1, dtype=np.intp)
+  candidate_averages = np.full([size, nbr_candidates], np.inf)
+  candidate_of = [[] for _ in range(size)]
+
+  # Row c is the sum of the distances from every vlmc to cluster c, identified by one of its
+  # vlmcs.  Starting from singletons, the candidates of a vlmc are the smallest of its row.
+  cluster_sums = np.empty([size, size], dtype=np.float64)
+  block_size = max(1, MAX_BLOCK_VALUES // size)
+  for start in range(0, size, block_size):
+    end = min(start + block_size, size)
+    cluster_sums[start:end] = distances.rows(start, end)
+    if nbr_candidates > 0:
+      averages = cluster_sums[start:end].copy()
+      averages[np.arange(end - start), np.arange(start, end)] = np.inf
+      closest = np.argpartition(averages, nbr_candidates - 1, axis=1)[:, :nbr_candidates]
+      _set_candidates(np.arange(start, end), closest, averages[np.arange(end - start)[:, None], closest],
+                      candidate_clusters, candidate_averages, candidate_of)
+  farthest = _farthest_candidates(candidate_clusters, candidate_averages)
+  closest_averages = np.min(candidate_averages, axis=1, initial=np.inf)
+  silhouettes = _silhouettes(own_sums, cluster_sizes[cluster_of], closest_averages)
+  average_silhouettes[size] = np.mean(silhouettes)
+
+  nbr_clusters = size
+  for left, right in zip(merge_left, merge_right):
+    kept, removed = cluster_of[left], cluster_of[right]
+    if kept == removed:
+      continue
+    cluster_sums[kept] += cluster_sums[removed]
+    cluster_sizes[kept] += cluster_sizes[removed]
+    alive[removed] = False
+    cluster_of[members[removed]] = kept
+    merged = members[kept] = np.concatenate([members[kept], members[removed]])
+    members[removed] = None
+    nbr_clusters -= 1
+
+    own_sums[merged] = cluster_sums[kept, merged]
+    if nbr_clusters > 1:
+      listed = candidate_of[kept] + candidate_of[removed]
+      candidate_of[kept], candidate_of[removed] = [], []
+      listed = np.unique(np.concatenate(listed)) if len(listed) > 0 else np.zeros(0, dtype=np.intp)
+      listed_clusters, listed_averages = candidate_clusters[listed], candidate_averages[listed]
+      dropped = (listed_clusters == kept) | (listed_clusters == removed)
+      listed_clusters[dropped] = -1
+      listed_averages[dropped] = np.inf
+      candidate_clusters[listed], candidate_averages[listed] = listed_clusters, listed_averages
+      dropped_from = listed[np.any(dropped, axis=1)]
+      farthest[dropped_from] = _farthest_candidates(candidate_clusters[dropped_from],
+                                                    candidate_averages[dropped_from])
+
+      # The merged cluster is a candidate when it is no farther than the farthest candidate,
+      # it takes an empty place or else the place of the farthest one
+      averages = cluster_sums[kept] / cluster_sizes[kept]
+      offered_to = np.flatnonzero((averages <= farthest) & (cluster_of != kept))
+      places = np.argmax(candidate_averages[offered_to], axis=1)
+      candidate_clusters[offered_to, places] = kept
+      candidate_averages[offered_to, places] = averages[offered_to]
+      candidate_of[kept].append(offered_to)
+      farthest[offered_to] = _farthest_candidates(candidate_clusters[offered_to], candidate_averages[offered_to])
+
+      emptied = dropped_from[np.all(candidate_clusters[dropped_from] < 0, axis=1)]
+      _search_candidates(emptied, cluster_sums, cluster_sizes, alive, cluster_of,
+                         candidate_clusters, candidate_averages, candidate_of)
+      farthest[emptied] = _farthest_candidates(candidate_clusters[emptied], candidate_averages[emptied])
+      searched = np.concatenate([dropped_from, offered_to])
+      closest_averages[searched] = np.min(candidate_averages[searched], axis=1)
+      # Every vlmc of the merged cluster has a new average distance to its own cluster
+      changed = np.concatenate([searched, merged])
+    else:
+      changed = np.arange(size)
+      closest_averages[:] = np.inf
+    silhouettes[changed] = _silhouettes(own_sums[changed], cluster_sizes[cluster_of[changed]],
+                                        closest_averages[changed])
+    average_silhouettes[nbr_clusters] = np.mean(silhouettes)
+
+  return average_silhouettes
+
+
+def _search_candidates(vlmcs, cluster_sums, cluster_sizes, alive, cluster_of,
+                       candidate_clusters, candidate_averages, candidate_of):
+  """
+    Fills the candidates of vlmcs with the alive clusters, other than their own, with the
+    smallest average distances, going through the vlmcs in blocks.
+  """
+  alive_clusters = np.flatnonzero(alive)
+  nbr_candidates = min(candidate_clusters.shape[1], len(alive_clusters) - 1)
+  if len(vlmcs) == 0 or nbr_candidates <= 0:
+    return
+  block_size = max(1, MAX_BLOCK_VALUES // len(alive_clusters))
+  for start in range(0, len(vlmcs), block_size):
+    block = vlmcs[start:start + block_size]
+    # [clusters, vlmcs]
+    averages = cluster_sums[np.ix_(alive_clusters, block)] / cluster_sizes[alive_clusters, None]
+    averages[alive_clusters[:, None] == cluster_of[block][None, :]] = np.inf
+    closest = np.argpartition(averages, nbr_candidates - 1, axis=0)[:nbr_candidates].T
+    _set_candidates(block, alive_clusters[closest], averages.T[np.arange(len(block))[:, None], closest],
+                    candidate_clusters, candidate_averages, candidate_of)
+
+
+def _set_candidates(vlmcs, clusters, averages, candidate_clusters, candidate_averages, candidate_of):
+  """
+    Replaces the candidates of vlmcs with clusters, [vlmcs, candidates], at their averages,
+    and lists the vlmcs under each of their new candidates.
+  """
+  nbr_candidates = clusters.shape[1]
+  candidate_clusters[vlmcs] = -1
+  candidate_averages[vlmcs] = np.inf
+  candidate_clusters[vlmcs, :nbr_candidates] = clusters
+  candidate_averages[vlmcs, :nbr_candidates] = averages
+
+  clusters = clusters.ravel()
+  listed = np.repeat(vlmcs, nbr_candidates)
+  order = np.argsort(clusters, kind='stable')
+  clusters, listed = clusters[order], listed[order]
+  group_starts = np.flatnonzero(np.diff(clusters, prepend=-1))
+  for group_start, group_end in zip(group_starts, np.append(group_starts[1:], len(clusters))):
+    candidate_of[clusters[group_start]].append(listed[group_start:group_end])
+
+
+def _farthest_candidates(candidate_clusters, candidate_averages):
+  """
+    The largest average of the candidates of every vlmc, -inf without candidates.
+  """
+  return np.max(np.where(candidate_clusters >= 0, candidate_averages, -np.inf), axis=1, initial=-np.inf)
+
+
+def _silhouettes(own_sums, own_sizes, closest_averages):
+  """
+    (b - a) / max(a, b), a is 0 for singletons.
+  """
+  with np.errstate(divide='ignore', invalid='ignore'):
+    own_averages = np.where(own_sizes > 1, own_sums / (own_sizes - 1), 0)
+    return (closest_averages - own_averages) / np.maximum(closest_averages, own_averages)
+
+
+def taxonomy_sweep(taxonomy_values, merge_left, merge_right):
+  """
+    For every number of clusters reached by merging, in order, the clusters of merge_left[i]
+    and merge_right[i], starting from singletons: the average percent of the same taxonomy
+    and the sensitivity and precision of the pairs in the same cluster, as three arrays
+    where entry k is for k clusters (NaN if not reached).  A merge adds the contingency
+    table row of one cluster to the other, which only changes their terms of the sums.
+  """
+  _, taxonomy = np.unique(taxonomy_values, return_inverse=True)
+  cdef Py_ssize_t size = len(taxonomy)
+  average_percents = np.full(size + 1, np.nan)
+  sensitivities = np.full(size + 1, np.nan)
+  precisions = np.full(size + 1, np.nan)
+  if size == 0:
+    return average_percents, sensitivities, precisions
+
+  contingency_table = np.zeros([size, np.max(taxonomy) + 1], dtype=np.int64)
+  contingency_table[np.arange(size), taxonomy] = 1
+  cluster_sizes = np.ones(size, dtype=np.int64)
+  cdef DisjointSet clusters = DisjointSet(size)
+
+  # Sums over the clusters of the squared contingency table rows (ordered pairs in the same
+  # cluster and taxonomy, including a vlmc with itself), of the squared cluster sizes, and
+  # of the first divided by the cluster size
+  same_cluster_and_taxonomy = size
+  same_cluster = size
+  same_taxonomy = int(np.sum(np.bincount(taxonomy).astype(np.int64) ** 2))
+  percent_sum = float(size)
+
+  nbr_clusters = size
+  _record_taxonomy_metrics(average_percents, sensitivities, precisions, nbr_clusters, size,
+                           same_cluster_and_taxonomy, same_cluster, same_taxonomy, percent_sum)
+  for left, right in zip(merge_left, merge_right):
+    left, right = clusters.find(left), clusters.find(right)
+    if left == right:
+      continue
+    merged_row = contingency_table[left] + contingency_table[right]
+    merged_size = cluster_sizes[left] + cluster_sizes[right]
+    left_squares = int(np.sum(contingency_table[left] ** 2))
+    right_squares = int(np.sum(contingency_table[right] ** 2))
+    merged_squares = int(np.sum(merged_row ** 2))
+
+    same_cluster_and_taxonomy += merged_squares - left_squares - right_squares
+    same_cluster += int(merged_size ** 2 - cluster_sizes[left] ** 2 - cluster_sizes[right] ** 2)
+    percent_sum += (merged_squares / merged_size - left_squares / cluster_sizes[left]
+                    - right_squares / cluster_sizes[right])
+
+    clusters.union(left, right)
+    root = clusters.find(left)
+    contingency_table[root] = merged_row
+    cluster_sizes[root] = merged_size
+    nbr_clusters -= 1
+    _record_taxonomy_metrics(average_percents, sensitivities, precisions, nbr_clusters, size,
+                             same_cluster_and_taxonomy, same_cluster, same_taxonomy, percent_sum)
+
+  return average_percents, sensitivities, precisions
+
+
+def _record_taxonomy_metrics(average_percents, sensitivities, precisions, nbr_clusters, size,
+                             same_cluster_and_taxonomy, same_cluster, same_taxonomy, percent_sum):
+  # Pairs of a vlmc with itself are not counted
+  true_positives = same_cluster_and_taxonomy - size
+  average_percents[nbr_clusters] = percent_sum / size
+  with np.errstate(divide='ignore', invalid='ignore'):
+    sensitivities[nbr_clusters] = np.float64(true_positives) / (same_taxonomy - size)
+    precisions[nbr_clusters] = np.float64(true_positives) / (same_cluster - size)
@@ -0,0 +1,25 @@
+cimport numpy as np
+
+ctypedef np.float32_t FLOATTYPE_t
+
+cdef class CondensedDistances:
+  """
+    Distances between n items, stored as the condensed upper triangle.
+  """
+
+  cdef public np.ndarray values
+  cdef public int size
+
+  cpdef Py_ssize_t index(self, Py_ssize_t left, Py_ssize_t right)
+
+  cpdef FLOATTYPE_t distance(self, Py_ssize_t left, Py_ssize_t right)
+
+  cpdef np.ndarray row(self, Py_ssize_t i)
+
+  cpdef np.ndarray rows(self, Py_ssize_t start, Py_ssize_t end)
+
+  cpdef np.ndarray square(self)
+
+  cpdef double mean(self)
+
+  cpdef tuple sorted_edges(self)
@@ -0,0 +1,116 @@
+import numpy as np
+cimport numpy as np
+
+FLOATTYPE = np.float32
+INTTYPE = np.int32
+
+
+cdef class CondensedDistances:
+  """
+    Distances between n items, stored as the condensed upper triangle (the same
+    order as scipy.spatial.distance.squareform): the distance between i < j is at
+    index n*i - i*(i+1)/2 + (j - i - 1).  Uses n*(n-1)/2 floats instead of n*n.
+    For 20k vlmcs that is 0.8 GB, where the [n*n, 3] triplets and the square matrix
+    they were indexed into took 6.4 GB.  Nothing is derived from the values and kept,
+    anything larger (a square matrix, the sorted edges) is built when it is asked for.
+  """
+
+  def __cinit__(self, values, size):
+    self.values = np.asarray(values, dtype=FLOATTYPE)
+    self.size = size
+    if len(self.values) != size * (size - 1) // 2:
+      raise ValueError("Expected {} condensed distances for {} items, got {}".format(
+          size * (size - 1) // 2, size, len(self.values)))
+
+  @classmethod
+  def from_square(cls, matrix):
+    """
+      Condenses a square matrix.  Asymmetric matrices are made symmetric
+      by averaging d(i, j) and d(j, i).
+    """
+    matrix = np.asarray(matrix)
+    upper_triangle = np.triu_indices(len(matrix), 1)
+    values = (matrix[upper_triangle] + matrix.T[upper_triangle]) / 2
+    return CondensedDistances(values, len(matrix))
+
+  def __getitem__(self, key):
+    left, right = key
+    return self.distance(left, right)
+
+  def __len__(self):
+    return self.size
+
+  cpdef Py_ssize_t index(self, Py_ssize_t left, Py_ssize_t right):
+    if left > right:
+      left, right = right, left
+    return self.size * left - left * (left + 1) // 2 + (right - left - 1)
+
+  cpdef FLOATTYPE_t distance(self, Py_ssize_t left, Py_ssize_t right):
+    if left == right:
+      return 0
+    return self.values[self.index(left, right)]
+
+  cpdef np.ndarray row(self, Py_ssize_t i):
+    """
+      The distances from i to every item, as a dense array.
+    """
+    cdef np.ndarray row = np.zeros(self.size, dtype=FLOATTYPE)
+    cdef np.ndarray before = np.arange(i)
+    # Column i of the items before, then the contiguous part of row i
+    row[:i] = self.values[self.size * before - before * (before + 1) // 2 + (i - before - 1)]
+    row_start = self.index(i, i + 1) if i < self.size - 1 else len(self.values)
+    row[i + 1:] = self.values[row_start:row_start + self.size - i - 1]
+    return row
+
+  cpdef np.ndarray rows(self, Py_ssize_t start, Py_ssize_t end):
+    """
+      The distances from the items start, ..., end - 1 to every item, as a dense
+      [end - start, n] array, so that the square matrix can be gone through in blocks.
+      After the diagonal every row is contiguous in the values, before it the block is
+      its own transpose, and the items before the block have a contiguous run each.
+    """
+    cdef Py_ssize_t i
+    cdef np.ndarray rows = np.zeros([end - start, self.size], dtype=FLOATTYPE)
+    if len(self.values) == 0 or end <= start:
+      return rows
+    for i in range(start, end):
+      row_start = self.size * i - i * (i + 1) // 2
+      rows[i - start, i + 1:] = self.values[row_start:row_start + self.size - i - 1]
+    rows[:, start:end] += rows[:, start:end].T.copy()
+    before = np.arange(start, dtype=np.int64)
+    run_starts = self.size * before - before * (before + 1) // 2 + (start - before - 1)
+    rows[:, :start] = self.values[run_starts[None, :] + np.arange(end - start, dtype=np.int64)[:, None]]
+    return rows
+
+  cpdef np.ndarray square(self):
+    cdef np.ndarray matrix = np.zeros([self.size, self.size], dtype=FLOATTYPE)
+    upper_triangle = np.triu_indices(self.size, 1)
+    matrix[upper_triangle] = self.values
+    matrix.T[upper_triangle] = self.values
+    return matrix
+
+  cpdef double mean(self):
+    return self.values.mean() if len(self.values) > 0 else 0.0
+
+  cpdef tuple sorted_edges(self):
+    """
+      The edges (left, right, distance), sorted by distance.  They are built on every call
+      and not kept: two int32 index arrays and the sorted float32 distances are three
+      times the size of the values, and the int64 sort order twice more while building.
+    """
+    order = np.argsort(self.values, kind='stable')
+    left, right = condensed_index_to_pair(order, self.size)
+    return left, right, self.values[order]
+
+
+cpdef tuple condensed_index_to_pair(indices, size):
+  """
+    The (left, right) pairs, left < right, of an array of condensed indices.
+  """
+  indices = np.asarray(indices, dtype=np.int64)
+  # Number of pairs from row i and onwards is (n - i)(n - i - 1)/2, solve for the row.
+  remaining = size * (size - 1) // 2 - indices
+  left = size - 1 - np.floor((1 + np.sqrt(8 * remaining - 7)) / 2).astype(np.int64)
+  row_start = size * left - left * (left + 1) // 2
+  right = indices - row_start + left + 1
+  return left.astype(INTTYPE), right.astype(INTTYPE)
@@ -18,8 +18,7 @@ cdef class DendrogramClustering(GraphBasedClustering):
         self.metadata[v.name]['genus'],
         self.metadata[v.name]['family'])
         for v in self.vlmcs]
-    condensed_distances = scipy.spatial.distance.squareform(self.indexed_distances, checks=False)
-    z = average(condensed_distances)
+    z = average(self.distances.values)
     plt.figure(figsize=(25, 200))
     dendrogram(z, labels=labels, leaf_font_size=18, orientation='right', color_threshold=0.15)
 
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .condensed_distances import CondensedDistances
+
+
+class DistanceStore(object):
+  """
+    Distances between vlmcs for one distance function, kept on disk as memory-mapped
+    arrays in <directory>/<distance>/, keyed by the distance function with its parameters.
+    Every vlmc that has been stored is an entry, identified by its name and fingerprint.
+    The distances are the lower triangle in row-major order, row i holds the distances to
+    the entries before it, so new vlmcs only add rows at the end.  Entries of vlmcs that
+    are no longer asked for are masked out and never calculated against again.
+    A row is only marked as calculated once its distances are written, so an interrupted
+    calculation resumes from the rows that are left.
+  """
+
+  def __init__(self, directory, d):
+    self.path = os.path.join(directory, distance_key(d))
+    os.makedirs(self.path, exist_ok=True)
+
+    self.description = {'distance': repr(d), 'entries': []}
+    if os.path.isfile(self._file('store.json')):
+      with open(self._file('store.json')) as f:
+        self.description = json.load(f)
+    self.entries = self.description['entries']
+    self._open_arrays()
+
+  def update(self, vlmcs):
+    """
+      Adds the vlmcs that are not stored yet, and masks out the entries whose vlmcs are not
+      among vlmcs.  Returns the vlmc of every entry (None for masked entries), and the entry
+      index of each of vlmcs.
+    """
+    entry_indices = {(name, fingerprint): i for i, (name, fingerprint, active) in enumerate(self.entries)
+                     if active}
+    fingerprints = [v.fingerprint() for v in vlmcs]
+    new_entries = [[v.name, fingerprint, True] for v, fingerprint in zip(vlmcs, fingerprints)
+                   if (v.name, fingerprint) not in entry_indices]
+    for i, (name, fingerprint, _) in enumerate(new_entries):
+      entry_indices[(name, fingerprint)] = len(self.entries) + i
+
+    indices = np.array([entry_indices[(v.name, fingerprint)]
+                        for v, fingerprint in zip(vlmcs, fingerprints)], dtype=np.intp)
+    entry_vlmcs = [None] * (len(self.entries) + len(new_entries))
+    for i, v in zip(indices, vlmcs):
+      entry_vlmcs[i] = v
+
+    removed_entries = [i for i, entry in enumerate(self.entries) if entry[2] and entry_vlmcs[i] is None]
+    if len(new_entries) > 0 or len(removed_entries) > 0:
+      for i in removed_entries:
+        self.entries[i][2] = False
+      self.entries.extend(new_entries)
+      self._resize_arrays()
+      self._write_description()
+      print("Distance store {}: {} new and {} removed vlmcs, {} entries".format(
+          self.path, len(new_entries), len(removed_entries), len(self.entries)))
+
+    # A masked entry whose row was never finished can not be calculated any more
+    masked_rows = np.array([entry_vlmcs[i] is None for i in range(len(self.entries))], dtype=bool)
+    if np.any(masked_rows & ~self.computed_rows):
+      self.computed_rows[masked_rows] = True
+      self.flush()
+
+    return entry_vlmcs, indices
+
+  def condensed_distances(self, indices):
+    """
+      The distances between the entries in indices, in that order, as condensed distances.
+    """
+    size = len(indices)
+    values = np.zeros(size * (size - 1) // 2, dtype=np.float32)
+    start = 0
+    for i in range(size - 1):
+      larger = np.maximum(indices[i], indices[i + 1:])
+      smaller = np.minimum(indices[i], indices[i + 1:])
+      values[start:start + len(larger)] = self.values[row_offsets(larger) + smaller]
+      start += len(larger)
+    return CondensedDistances(values, size)
+
+  def is_complete(self):
+    return bool(np.all(self.computed_rows))
+
+  def flush(self):
+    for array in [self.values, self.computed_rows]:
+      if isinstance(array, np.memmap):
+        array.flush()
+
+  def _file(self, file_name):
+    return os.path.join(self.path, file_name)
+
+  def _open_arrays(self):
+    nbr_entries = len(self.entries)
+    self.computed_rows = _open(self._file('computed_rows.npy'), np.bool_, nbr_entries)
+    self.values = _open(self._file('distances.npy'), np.float32, nbr_entries * (nbr_entries - 1) // 2)
+
+  def _resize_arrays(self):
+    """
+      Grows the arrays to the number of entries, the stored rows are a prefix of the new ones.
+    """
+    old_computed_rows, old_values = self.computed_rows, self.values
+    nbr_entries = len(self.entries)
+    for file_name, dtype, length, old in [('computed_rows.npy', np.bool_, nbr_entries, old_computed_rows),
+                                          ('distances.npy', np.float32, nbr_entries * (nbr_entries - 1) // 2, old_values)]:
+      if length == len(old):
+        continue
+      # Write to a temporary file first, so an interruption never leaves half an array
+      temporary_path = "{}.{}.tmp".format(self._file(file_name), os.getpid())
+      resized = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=dtype, shape=(length,))
+      resized[:len(old)] = old
+      resized.flush()
+      del resized
+      os.replace(temporary_path, self._file(file_name))
+    del old_computed_rows, old_values
+    self._open_arrays()
+
+  def _write_description(self):
+    temporary_path = "{}.{}.tmp".format(self._file('store.json'), os.getpid())
+    with open(temporary_path, 'w') as f:
+      json.dump(self.description, f)
+    os.replace(temporary_path, self._file('store.json'))
+
+
+def _open(path, dtype, length):
+  if length == 0:
+    return np.zeros(0, dtype=dtype)
+  if not os.path.isfile(path):
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(length,))
+  array = np.lib.format.open_memmap(path, mode='r+')
+  # An interrupted resize can leave a longer array behind, of which the prefix is valid
+  return array[:length]
+
+
+def row_offsets(rows):
+  """
+    Index of the first distance of the rows in the lower triangle.
+  """
+  rows = np.asarray(rows, dtype=np.int64)
+  return rows * (rows - 1) // 2
+
+
+def distance_key(d):
+  """
+    Name of the directory for a distance function, the repr includes its parameters.
+  """
+  return "{}_{}".format(d.__class__.__name__, _hash(repr(d))[:12])
+
+
+def _hash(s):
+  return hashlib.sha1(s.encode('utf-8')).hexdigest()
@@ -1,10 +1,9 @@
 import os
-import networkx as nx
 import csv
-from itertools import product
 import numpy as np
 
 from .clustering_metrics import ClusteringMetrics
+from .condensed_distances import CondensedDistances
 
 
 class FromVsearch:
@@ -29,13 +28,11 @@ class FromVsearch:
     used_vlmcs_names = [v.name for vs in vlmc_clusters.values() for v in vs]
     used_metadata = {k: v for k, v in self.metadata.items() if k in used_vlmcs_names}
 
-    G = nx.Graph()
-    G.add_nodes_from(used_vlmcs)
+    labels = np.array([i for i, vs in enumerate(vlmc_clusters.values()) for v in vs], dtype=np.int32)
 
-    self._connect_clusters(vlmc_clusters, G)
-
-    zero_distances = np.ones([len(used_vlmcs), len(used_vlmcs)])
-    metrics = ClusteringMetrics(G, 0, zero_distances, used_vlmcs, used_metadata)
+    nbr_vlmcs = len(used_vlmcs)
+    zero_distances = CondensedDistances(np.ones(nbr_vlmcs * (nbr_vlmcs - 1) // 2), nbr_vlmcs)
+    metrics = ClusteringMetrics(labels, 0, zero_distances, used_vlmcs, used_metadata, [])
     return metrics
 
   def _parse_row(self, row, clusters):
@@ -65,9 +62,3 @@ class FromVsearch:
     for v in vlmcs:
       if v.name == aid:
         return v
-
-  def _connect_clusters(self, clusters, G):
-    for cluster in clusters.values():
-      pairs = product(cluster, repeat=2)
-      for v1, v2 in pairs:
-        G.add_edge(v1, v2)
@@ -1,5 +1,6 @@
 import time
 import numpy as np
+import scipy.sparse
 
 cimport numpy as np
 
@@ -7,6 +8,8 @@ np.set_printoptions(threshold=np.nan)
 
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
+# The square distance and similarity matrices are handled in blocks of rows of at most this many values
+MAX_BLOCK_VALUES = 2**22
 
 
 from mst_clustering import MSTClustering
@@ -15,6 +18,8 @@ from average_link_clustering import AverageLinkClustering
 from average_link_clustering cimport AverageLinkClustering
 
 from graph_based_clustering cimport GraphBasedClustering
+from condensed_distances cimport CondensedDistances
+from condensed_distances import CondensedDistances
 
 
 cdef class FuzzySimilarityClustering(AverageLinkClustering):
@@ -22,57 +27,83 @@ cdef class FuzzySimilarityClustering(AverageLinkClustering):
     Clusters the the vlmcs based on the fuzzy similarity measure.
   """
 
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] _calculate_distances(self):
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] distances = GraphBasedClustering._calculate_distances(self)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] sorted_distances = distances[distances[:, 2].argsort()]
+  cdef CondensedDistances _calculate_distances(self):
+    cdef CondensedDistances distances = GraphBasedClustering._calculate_distances(self)
 
     k = 5
     rmax = 10
     alpha = 0.001
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] fuzzy_similarity_measures = \
-        self._calculate_fuzzy_similarity_measures(sorted_distances, k, rmax, alpha)
+    return fuzzy_similarity_measures(distances, k, rmax, alpha)
 
-    self.indexed_distances = fuzzy_similarity_measures
 
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] fuzzy_similarity_measures_extended = \
-        self._extend_format(fuzzy_similarity_measures)
-
-    return fuzzy_similarity_measures_extended
-
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] _extend_format(self, fuzzy_similarity_measures):
-    cdef int num_vlmcs = len(self.vlmcs)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] fuzzy_measure = np.zeros([fuzzy_similarity_measures.size, 3], dtype=FLOATTYPE)
-    cdef int i, j
-    for i in range(len(self.vlmcs)):
-      for j in range(len(self.vlmcs)):
-        index = i * num_vlmcs + j
-        fuzzy_measure[index, 0] = i
-        fuzzy_measure[index, 1] = j
-        fuzzy_measure[index, 2] = fuzzy_similarity_measures[i, j]
-
-    return fuzzy_measure
-
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] _calculate_fuzzy_similarity_measures(self, distances, k, rmax, alpha):
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] fuzzy_similarity_measures = np.zeros([len(self.vlmcs), len(self.vlmcs)], dtype=FLOATTYPE)
-    for r in range(1, rmax + 1):
-      for i, left in enumerate(self.vlmcs):
-        for j, right in enumerate(self.vlmcs):
-          fuzzy_similarity_measures[i, j] = (1 - alpha) * fuzzy_similarity_measures[i, j] + \
-              alpha * self._fuzzy_similarity(i, j, k, r, distances)
-
-    return fuzzy_similarity_measures
-
-  cdef FLOATTYPE_t _fuzzy_similarity(self, i, j, k, r, distances):
-    i_neighbours = self._k_nearest_neighbours(i, k * r, distances)
-    j_neighbours = self._k_nearest_neighbours(j, k * r, distances)
-    shared_neighbours_idx = np.where(np.equal(i_neighbours, j_neighbours))
-    shared_neighbours = i_neighbours[shared_neighbours_idx]
-
-    denominator = 2 * k * r - shared_neighbours.size
+cpdef CondensedDistances fuzzy_similarity_measures(CondensedDistances distances, k, rmax, alpha):
+  """
+    F_r = (1 - alpha) F_r-1 + alpha s_r, with s_r(i, j) = -|N_kr(i) ∩ N_kr(j)| / (2kr - |N_kr(i) ∩ N_kr(j)|)
+    where N_kr(i) are the k·r nearest neighbours of i.  The neighbours are found once for
+    r = rmax, and the shared neighbours of all pairs are a sparse matrix product for every r.
+    F is symmetric, so it is kept as condensed values and updated in blocks of rows.
+  """
+  cdef Py_ssize_t size = distances.size
+  cdef np.ndarray values = np.zeros(size * (size - 1) // 2, dtype=FLOATTYPE)
+  # The k·rmax nearest neighbours of every vlmc, closest first
+  cdef np.ndarray neighbours = nearest_neighbours(distances, min(k * rmax, size))
+  block_size = max(1, MAX_BLOCK_VALUES // max(size, 1))
+  for r in range(1, rmax + 1):
+    neighbour_matrix = _neighbour_matrix(neighbours[:, :min(k * r, size)], size)
+    shared_neighbours = (neighbour_matrix @ neighbour_matrix.T).tocsr()
+    for block_start in range(0, size, block_size):
+      block_end = min(block_start + block_size, size)
+      # The upper triangle of a block of rows is contiguous in the condensed values
+      rows = np.arange(block_start, block_end)
+      in_triangle = np.arange(size)[None, :] > rows[:, None]
+      start = distances.index(block_start, block_start + 1) if block_start < size - 1 else len(values)
+      shared = shared_neighbours[block_start:block_end].toarray()[in_triangle]
+      fuzzy_similarity = - shared / (2 * k * r - shared)
+      values[start:start + len(shared)] = \
+          (1 - alpha) * values[start:start + len(shared)].astype(np.float64) + alpha * fuzzy_similarity
+
+  return CondensedDistances(values, size)
+
+
+def nearest_neighbours(CondensedDistances distances, nbr_neighbours):
+  """
+    The nbr_neighbours closest items of every item (including itself), closest first, with
+    ties in the order of the items as a stable sort of the rows gives.  The distances and
+    the indices are combined into one integer key per pair, so argpartition has no ties.
+    The rows are built from the condensed distances a block at a time.
+  """
+  cdef Py_ssize_t size = distances.size
+  neighbours = np.zeros([size, nbr_neighbours], dtype=np.intp)
+  if nbr_neighbours == 0:
+    return neighbours
+  indices = np.arange(size, dtype=np.uint64)
+  block_size = max(1, MAX_BLOCK_VALUES // size)
+  for block_start in range(0, size, block_size):
+    block_end = min(block_start + block_size, size)
+    keys = (_sortable_bits(distances.rows(block_start, block_end)) << np.uint64(32)) | indices[None, :]
+    if nbr_neighbours < size:
+      closest = np.argpartition(keys, nbr_neighbours - 1, axis=1)[:, :nbr_neighbours]
+    else:
+      closest = np.broadcast_to(np.arange(size), keys.shape)
+    order = np.argsort(np.take_along_axis(keys, closest, axis=1), axis=1)
+    neighbours[block_start:block_end] = np.take_along_axis(closest, order, axis=1)
+  return neighbours
+
+
+def _sortable_bits(values):
+  """
+    The bits of float32 values as unsigned integers in the same order as the values.
+  """
+  bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+  # Negative values have every bit flipped, non-negative ones only the sign bit
+  flip = np.where(bits >> np.uint32(31), np.uint32(0xFFFFFFFF), np.uint32(0x80000000))
+  return (bits ^ flip).astype(np.uint64)
 
-    return - shared_neighbours.size / denominator
 
-  cdef np.ndarray _k_nearest_neighbours(self, i, k, distances):
-    neighbour_idx = np.where(distances[:, 0] == i)
-    neighbours = distances[neighbour_idx]
-    return neighbours[0:k]
+def _neighbour_matrix(neighbours, size):
+  """
+    Sparse [items, items] matrix with a one for every neighbour of every item.
+  """
+  rows = np.repeat(np.arange(len(neighbours)), neighbours.shape[1])
+  return scipy.sparse.csr_matrix((np.ones(rows.size, dtype=np.float64), (rows, neighbours.ravel())),
+                                 shape=(len(neighbours), size))
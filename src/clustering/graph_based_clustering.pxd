@@ -2,6 +2,9 @@ cimport numpy as np
 
 ctypedef np.float32_t FLOATTYPE_t
 
+from condensed_distances cimport CondensedDistances
+from linkage cimport DisjointSet
+
 cdef class GraphBasedClustering:
   """
     Super class for every graph-based clustering method.
@@ -9,26 +12,33 @@ cdef class GraphBasedClustering:
 
   cdef list vlmcs
   cdef object d
-  cdef str file_name
-  cdef np.ndarray distances
-  cdef np.ndarray indexed_distances
+  cdef object distance_directory
+  cdef CondensedDistances distances
   cdef int created_clusters
-  cdef object G
+  cdef int processes
+  cdef DisjointSet clusters
   cdef dict metadata
   cdef list merge_distances
+  cdef np.ndarray merge_left
+  cdef np.ndarray merge_right
+  cdef np.ndarray merge_history
 
   cpdef object cluster(self, clusters)
 
+  cpdef bint has_merge_history(self)
+
+  cpdef np.ndarray linkage_matrix(self)
+
+  cpdef np.ndarray sweep(self, taxonomies=*, meta_key=*)
+
   cdef void _initialise_clusters(self)
 
   cdef void _cluster(self, num_clusters, distances)
 
+  cdef void _cluster_from_merge_history(self, num_clusters)
+
   cdef tuple _find_min_edge(self)
 
   cdef void _merge_clusters(self, left, right)
 
-  cdef void _make_fully_connected_components(self)
-
-  cdef FLOATTYPE_t _find_distance_from_vlmc(self, v1, v2)
-
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] _calculate_distances(self)
+  cdef CondensedDistances _calculate_distances(self)
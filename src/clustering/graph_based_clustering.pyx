@@ -1,10 +1,11 @@
-import networkx as nx
-
 import numpy as np
 cimport numpy as np
 import time
 from util import calculate_distances_within_vlmcs
-from clustering_metrics import ClusteringMetrics
+from clustering_metrics import ClusteringMetrics, silhouette_sweep, taxonomy_sweep
+from condensed_distances cimport CondensedDistances
+from linkage cimport DisjointSet
+from linkage import DisjointSet, linkage_matrix
 
 FLOATTYPE = np.float32
 
@@ -13,57 +14,38 @@ cdef class GraphBasedClustering:
     Super class for every graph-based clustering method.
   """
 
-  def __cinit__(self, vlmcs, d, metadata):
+  def __cinit__(self, vlmcs, d, metadata, processes=1, distance_directory=None):
     self.vlmcs = vlmcs
+    self.processes = processes
+    self.distance_directory = distance_directory
     self.d = d
-    self.file_name = 'cluster_distances'
     self.metadata = metadata
-    self.indexed_distances = np.ndarray([len(vlmcs), len(vlmcs)], dtype=FLOATTYPE)
     self.merge_distances = []
 
-    G = nx.Graph()
-    G.add_nodes_from(self.vlmcs)
-
     start_time = time.time()
     self.distances = self._calculate_distances()
     distance_time = time.time() - start_time
     print("Distance time: {} s".format(distance_time))
 
     self.created_clusters = len(vlmcs)
-    self.G = nx.Graph()
-    self.G.add_nodes_from(self.vlmcs)
+    self.clusters = DisjointSet(len(vlmcs))
 
   cdef void _initialise_clusters(self):
     return
 
   cpdef object cluster(self, clusters):
     if clusters > self.created_clusters:
-      self.G = nx.Graph()
-      self.G.add_nodes_from(self.vlmcs)
+      self.clusters = DisjointSet(len(self.vlmcs))
 
     self._cluster(clusters, self.distances)
 
-    self._make_fully_connected_components()
-
     self.created_clusters = clusters
 
-    distance_mean = np.mean(self.distances, axis=None)
-    metrics = ClusteringMetrics(self.G, distance_mean, self.indexed_distances,
+    distance_mean = self.distances.mean()
+    metrics = ClusteringMetrics(self.clusters.labels(), distance_mean, self.distances,
                                 self.vlmcs, self.metadata, self.merge_distances)
     return metrics
 
-  cdef void _make_fully_connected_components(self):
-    connected_components = nx.connected_components(self.G)
-    for component in connected_components:
-      for v1 in component:
-        for v2 in component:
-          self.G.add_edge(v1, v2, weight=self._find_distance_from_vlmc(v1, v2))
-
-  cdef FLOATTYPE_t _find_distance_from_vlmc(self, v1, v2):
-    v1_idx = self.vlmcs.index(v1)
-    v2_idx = self.vlmcs.index(v2)
-    return self.indexed_distances[v1_idx, v2_idx]
-
   cdef void _cluster(self, num_clusters, distances):
     start_time = time.time()
 
@@ -81,33 +63,75 @@ cdef class GraphBasedClustering:
 
       self.merge_distances.append(distance)
 
-      self.G.add_edge(self.vlmcs[left[0]], self.vlmcs[right[0]],
-                      weight=self.indexed_distances[left[0], right[0]])
+      self.clusters.union(left[0], right[0])
       self._merge_clusters(left, right)
 
     cluster_time = time.time() - start_time
     print("Cluster time: {} s".format(cluster_time))
 
+  cdef void _cluster_from_merge_history(self, num_clusters):
+    """
+      For methods that compute every merge up front, in merge_left, merge_right and
+      merge_history (the distances), k clusters are the first n - k merges.  Every merge
+      joins the clusters of its two vlmcs, only the merges not joined already are added.
+    """
+    if self.created_clusters < num_clusters:
+      first_merge = 0
+    else:
+      first_merge = len(self.vlmcs) - self.created_clusters
+    last_merge = min(len(self.vlmcs) - num_clusters, len(self.merge_history))
+
+    for i in range(first_merge, last_merge):
+      self.clusters.union(self.merge_left[i], self.merge_right[i])
+
+    self.merge_distances = list(self.merge_history[:last_merge])
+
+  cpdef bint has_merge_history(self):
+    return self.merge_history is not None
+
+  cpdef np.ndarray linkage_matrix(self):
+    """
+      The merge history as a scipy linkage matrix.
+    """
+    return linkage_matrix(self.merge_left, self.merge_right, self.merge_history, len(self.vlmcs))
+
+  cpdef np.ndarray sweep(self, taxonomies=('organism', 'family', 'genus'), meta_key='family'):
+    """
+      The metrics for every number of clusters, from one pass over the merge history instead
+      of clustering and building the metrics for every k.  Row k of the returned record array
+      is for k clusters (NaN if the merges never reach k): the average silhouette, the average
+      percent of the same taxonomy for each of taxonomies, the sensitivity and precision of
+      meta_key, and the distance of the last merge (-1 before the first merge).
+    """
+    if not self.has_merge_history():
+      raise RuntimeError("{} has no merge history to sweep".format(self.__class__.__name__))
+    start_time = time.time()
+    nbr_vlmcs = len(self.vlmcs)
+    fields = (['silhouette'] + ['percent_' + taxonomy for taxonomy in taxonomies]
+              + ['sensitivity', 'precision', 'merge_distance'])
+    metrics = np.full(nbr_vlmcs + 1, np.nan, dtype=[(field, np.float64) for field in fields])
+
+    metrics['silhouette'] = silhouette_sweep(self.distances, self.merge_left, self.merge_right)
+    for taxonomy in taxonomies:
+      values = [self.metadata[v.name][taxonomy] for v in self.vlmcs]
+      metrics['percent_' + taxonomy] = taxonomy_sweep(values, self.merge_left, self.merge_right)[0]
+    values = [self.metadata[v.name][meta_key] for v in self.vlmcs]
+    _, metrics['sensitivity'], metrics['precision'] = taxonomy_sweep(values, self.merge_left, self.merge_right)
+
+    # k clusters are the first n - k merges
+    nbr_merges = len(self.merge_history)
+    metrics['merge_distance'][nbr_vlmcs] = -1
+    metrics['merge_distance'][nbr_vlmcs - nbr_merges:nbr_vlmcs] = self.merge_history[::-1]
+    print("Sweep time: {} s".format(time.time() - start_time))
+    return metrics
+
   cdef tuple _find_min_edge(self):
-    [left, right, distance] = np.random.choice(self.distances)
-    return ((left,), (right,), distance)
+    left, right = np.random.choice(len(self.vlmcs), 2, replace=False)
+    return ((left,), (right,), self.distances.distance(left, right))
 
   cdef void _merge_clusters(self, left, right):
     return
 
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] _calculate_distances(self):
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] distances = calculate_distances_within_vlmcs(self.vlmcs, self.d)
-    # cdef np.ndarray[FLOATTYPE_t, ndim = 2] distances = np.load("kl_cluster_distances.npy")
-    cdef int left_i = -1
-    cdef int right_i = -1
-    cdef FLOATTYPE_t dist = -1.0
-
-    for column in distances:
-      left_i = column[0]
-      right_i = column[1]
-      dist = column[2]
-      self.indexed_distances[left_i, right_i] = dist
-
-    np.save(self.file_name, distances)
-
-    return distances
+  cdef CondensedDistances _calculate_distances(self):
+    return calculate_distances_within_vlmcs(
+        self.vlmcs, self.d, self.processes, self.distance_directory)
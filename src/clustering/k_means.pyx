@@ -1,12 +1,11 @@
-from itertools import product
-import networkx as nx
+from operator import itemgetter
+import multiprocessing
 import numpy as np
 cimport numpy as np
-import random
-import math
+import scipy.sparse
 
 
-from util import calculate_distances_within_vlmcs, index_distances
+from util import calculate_distances_within_vlmcs
 from clustering_metrics import ClusteringMetrics
 from distance.projection cimport Projection
 
@@ -15,100 +14,206 @@ ctypedef np.int32_t INTTYPE_t
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
 
+# Set in every worker process, so the vectors are shipped once per worker instead of once per restart.
+_worker_vectors = None
+
+
 cdef class KMeans:
+  """
+    K-means over the (sparse) Projection vectors of the vlmcs.  The assignment is one batched
+    distance computation per iteration and the centroids are updated from per-cluster sums.
+    The centroids are seeded with k-means++ (or randomly with init='random'), the best
+    of a number of restarts is kept, and the restarts are spread over processes.  With a
+    batch_size, every iteration updates the centroids from a random mini-batch instead.
+  """
   cdef list vlmcs
   cdef dict vlmc_to_array_index
-  cdef np.ndarray projected_vlmcs
+  cdef object projected_vlmcs
   cdef int nbr_vlmcs
   cdef Projection distance_function
   cdef dict metadata
-
-  def __cinit__(self, vlmcs, d, metadata):
+  cdef int processes
+  cdef object distance_directory
+  cdef object distances
+  cdef str init
+  cdef int restarts
+  cdef int max_iterations
+  cdef object batch_size
+  cdef object seed
+
+  def __cinit__(self, vlmcs, d, metadata, processes=1, distance_directory=None,
+                init='k-means++', restarts=1, max_iterations=300, batch_size=None, seed=None):
     self.vlmcs = vlmcs
+    self.processes = processes
+    self.distance_directory = distance_directory
     self.distance_function = d
     self.distance_function.set_vlmcs(vlmcs)
     self.nbr_vlmcs = len(vlmcs)
-    self.projected_vlmcs = np.zeros(
-        [self.nbr_vlmcs, self.distance_function.dimension], dtype=FLOATTYPE)
+    self.projected_vlmcs = self.distance_function.embedding(vlmcs)
     self.initialize_vlmc_to_index_dict()
     self.metadata = metadata
+    self.distances = None
+    self.init = init
+    self.restarts = restarts
+    self.max_iterations = max_iterations
+    self.batch_size = batch_size
+    self.seed = seed
 
   cdef initialize_vlmc_to_index_dict(self):
     self.vlmc_to_array_index = {}
     for i, vlmc in enumerate(self.vlmcs):
-      self.projected_vlmcs[i, :] = self.distance_function.vlmc_to_vector(vlmc)
       self.vlmc_to_array_index[vlmc] = i
 
   cpdef object cluster(self, nbr_clusters):
-    cdef np.ndarray[INTTYPE_t, ndim = 1] vlmc_index_to_cluster_index = np.zeros(self.nbr_vlmcs, dtype=INTTYPE)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] centroids = self.initialize_centroids_randomly(nbr_clusters)
-
-    cdef bint some_vlmc_changed_cluster = True
-    cdef int new_cluster = -1
-    while some_vlmc_changed_cluster:
-      # Assign vlmcs to closest centroid
-      some_vlmc_changed_cluster = False
-      for i, _ in enumerate(vlmc_index_to_cluster_index):
-        new_cluster = self.find_closest_centroid(centroids, i)
-        if new_cluster != vlmc_index_to_cluster_index[i]:
-          vlmc_index_to_cluster_index[i] = new_cluster
-          some_vlmc_changed_cluster = True
-
-      # Update centroids
-      for i in range(nbr_clusters):
-        self.update_centroid(centroids, i, vlmc_index_to_cluster_index)
-
-    G = self.create_graph(nbr_clusters, vlmc_index_to_cluster_index)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] distances = calculate_distances_within_vlmcs(self.vlmcs, self.distance_function)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] indexed_distances = index_distances(self.vlmcs, distances)
-
-    metrics = ClusteringMetrics(G, distances.mean(),
-                                indexed_distances, self.vlmcs, self.metadata, [])
+    seeds = np.random.SeedSequence(self.seed).spawn(self.restarts)
+    restarts = [(nbr_clusters, self.init, self.max_iterations, self.batch_size, seed) for seed in seeds]
+    if self.processes > 1 and self.restarts > 1:
+      with multiprocessing.Pool(min(self.processes, self.restarts), initializer=_initialise_worker,
+                                initargs=(self.projected_vlmcs,)) as pool:
+        results = pool.map(_k_means_restart, restarts)
+    else:
+      _initialise_worker(self.projected_vlmcs)
+      results = [_k_means_restart(restart) for restart in restarts]
+    vlmc_index_to_cluster_index, centroids, inertia = min(results, key=itemgetter(2))
+
+    if self.distances is None:
+      self.distances = calculate_distances_within_vlmcs(
+          self.vlmcs, self.distance_function, self.processes, self.distance_directory)
+
+    metrics = ClusteringMetrics(vlmc_index_to_cluster_index, self.distances.mean(),
+                                self.distances, self.vlmcs, self.metadata, [])
     return metrics
 
-  cdef object create_graph(self, nbr_clusters, vlmc_index_to_cluster_index):
-    G = nx.Graph()
-    G.add_nodes_from(self.vlmcs)
-    for i in range(nbr_clusters):
-      # Add each cluster to the graph
-      vlmc_indices_in_current_cluster = [vlmc for vlmc, index in self.vlmc_to_array_index.items() if
-                                         vlmc_index_to_cluster_index[index] == i]
-      for x, y in product(vlmc_indices_in_current_cluster, vlmc_indices_in_current_cluster):
-        G.add_edge(x, y)
-    return G
-
-  cdef void update_centroid(self, centroids, centroid_index, vlmc_index_to_cluster_index):
-    vlmc_indices_in_current_cluster = [j for (j, cluster_index) in enumerate(vlmc_index_to_cluster_index) if
-                                       cluster_index == centroid_index]
-    if len(vlmc_indices_in_current_cluster) > 0:
-      new_centroid = np.zeros([1, self.distance_function.dimension])
-      for k in vlmc_indices_in_current_cluster:
-        new_centroid[0, :] = new_centroid[0, :] + self.projected_vlmcs[k, :]
-      normalizing_factor = 1.0 / len(vlmc_indices_in_current_cluster)
-      new_centroid[0, :] = normalizing_factor * new_centroid[0, :]
-      centroids[centroid_index, :] = new_centroid[0, :]
-
-  cdef INTTYPE_t find_closest_centroid(self, centroids, vlmc_index):
-    closest_centroid = -1
-    min_distance = math.inf
-    for centroid_index, _ in enumerate(centroids):
-      distance_vector = self.projected_vlmcs[vlmc_index, :] - centroids[centroid_index, :]
-      distance = np.linalg.norm(distance_vector)
-      if (distance < min_distance):
-        min_distance = distance
-        closest_centroid = centroid_index
-    return closest_centroid
-
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] initialize_centroids_randomly(self, nbr_clusters):
-    centroid_indices = random.sample(range(self.nbr_vlmcs), nbr_clusters)
-    cdef np.ndarray[FLOATTYPE_t, ndim = 2] centroids = np.zeros([nbr_clusters, self.distance_function.dimension], dtype=FLOATTYPE)
-    for i, centroid_index in enumerate(centroid_indices):
-      centroids[i, :] = self.projected_vlmcs[centroid_index, :]
-    return centroids
-
   cdef FLOATTYPE_t distance(self, left, right):
-    left_vector_i = self.vlmc_to_array_index[left]
-    right_vector_i = self.vlmc_to_array_index[right]
-    left_vector = self.projected_vlmcs[left_vector_i, :]
-    right_vector = self.projected_vlmcs[right_vector_i, :]
+    left_vector = _dense_rows(self.projected_vlmcs, [self.vlmc_to_array_index[left]])
+    right_vector = _dense_rows(self.projected_vlmcs, [self.vlmc_to_array_index[right]])
     return np.linalg.norm(left_vector - right_vector)
+
+
+def _initialise_worker(vectors):
+  global _worker_vectors
+  _worker_vectors = vectors
+
+
+def _k_means_restart(restart):
+  """
+    One run of k-means, returns (labels, centroids, inertia).
+  """
+  nbr_clusters, init, max_iterations, batch_size, seed = restart
+  rng = np.random.default_rng(seed)
+  vectors = _worker_vectors
+  squared_norms = _squared_norms(vectors)
+
+  if init == 'random':
+    centroids = _dense_rows(vectors, rng.choice(vectors.shape[0], nbr_clusters, replace=False))
+  else:
+    centroids = k_means_plus_plus(vectors, squared_norms, nbr_clusters, rng)
+
+  if batch_size is None:
+    labels, centroids = _lloyd(vectors, squared_norms, centroids, max_iterations)
+  else:
+    centroids = _mini_batch(vectors, squared_norms, centroids, max_iterations, batch_size, rng)
+    labels, _ = assign_to_centroids(vectors, squared_norms, centroids)
+
+  _, min_squared_distances = assign_to_centroids(vectors, squared_norms, centroids)
+  return labels, centroids, float(np.sum(min_squared_distances))
+
+
+def _lloyd(vectors, squared_norms, centroids, max_iterations):
+  labels = np.full(vectors.shape[0], -1, dtype=INTTYPE)
+  for iteration in range(max_iterations):
+    new_labels, _ = assign_to_centroids(vectors, squared_norms, centroids)
+    if np.array_equal(new_labels, labels):
+      break
+    labels = new_labels
+    centroids = update_centroids(vectors, labels, centroids)
+  return labels, centroids
+
+
+def _mini_batch(vectors, squared_norms, centroids, max_iterations, batch_size, rng):
+  """
+    Mini-batch k-means: every centroid moves towards the vectors of the batch assigned
+    to it, with a learning rate of one over the number of vectors it has seen.
+  """
+  counts = np.zeros(len(centroids), dtype=np.float64)
+  for iteration in range(max_iterations):
+    batch = rng.choice(vectors.shape[0], min(batch_size, vectors.shape[0]), replace=False)
+    labels, _ = assign_to_centroids(vectors[batch], squared_norms[batch], centroids)
+    batch_sums, batch_counts = cluster_sums(vectors[batch], labels, len(centroids))
+
+    seen = batch_counts > 0
+    counts[seen] += batch_counts[seen]
+    # c <- c + (sum of batch vectors - batch count * c) / count, the running mean
+    centroids[seen] += (batch_sums[seen] - batch_counts[seen, None] * centroids[seen]) / counts[seen, None]
+  return centroids
+
+
+def assign_to_centroids(vectors, squared_norms, centroids):
+  """
+    The closest centroid of every vector, and the squared distance to it, from
+    |x - c|² = |x|² - 2 x·c + |c|² as one matrix product.
+  """
+  squared_distances = (squared_norms[:, None] - 2 * np.asarray(vectors @ centroids.T.astype(vectors.dtype))
+                       + np.einsum('ij,ij->i', centroids, centroids)[None, :])
+  labels = np.argmin(squared_distances, axis=1).astype(INTTYPE)
+  min_squared_distances = np.maximum(squared_distances[np.arange(vectors.shape[0]), labels], 0)
+  return labels, min_squared_distances
+
+
+def update_centroids(vectors, labels, centroids):
+  """
+    The mean of the vectors of every cluster, empty clusters keep their centroid.
+  """
+  sums, counts = cluster_sums(vectors, labels, len(centroids))
+  new_centroids = centroids.copy()
+  non_empty = counts > 0
+  new_centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+  return new_centroids
+
+
+def cluster_sums(vectors, labels, nbr_clusters):
+  """
+    The sum of the vectors of every cluster, and their number.  The sums are one product
+    with the sparse cluster membership matrix, which is far faster than np.add.at and
+    works for sparse vectors too.
+  """
+  counts = np.bincount(labels, minlength=nbr_clusters)
+  membership = scipy.sparse.csr_matrix(
+      (np.ones(len(labels)), (labels, np.arange(len(labels)))), shape=(nbr_clusters, len(labels)))
+  sums = membership @ vectors
+  if scipy.sparse.issparse(sums):
+    sums = sums.toarray()
+  return np.asarray(sums, dtype=np.float64), counts
+
+
+def k_means_plus_plus(vectors, squared_norms, nbr_clusters, rng):
+  """
+    Picks every next centroid with probability proportional to the squared distance
+    to the closest centroid so far.
+  """
+  centroids = np.zeros([nbr_clusters, vectors.shape[1]], dtype=np.float64)
+  centroids[0] = _dense_rows(vectors, [rng.integers(vectors.shape[0])])[0]
+  _, min_squared_distances = assign_to_centroids(vectors, squared_norms, centroids[:1])
+  for i in range(1, nbr_clusters):
+    total = np.sum(min_squared_distances)
+    if total > 0:
+      centroid_index = rng.choice(vectors.shape[0], p=min_squared_distances / total)
+    else:
+      centroid_index = rng.integers(vectors.shape[0])
+    centroids[i] = _dense_rows(vectors, [centroid_index])[0]
+    _, squared_distances = assign_to_centroids(vectors, squared_norms, centroids[i:i + 1])
+    min_squared_distances = np.minimum(min_squared_distances, squared_distances)
+  return centroids
+
+
+def _squared_norms(vectors):
+  if scipy.sparse.issparse(vectors):
+    return np.asarray(vectors.multiply(vectors).sum(axis=1), dtype=np.float64).ravel()
+  return np.einsum('ij,ij->i', vectors, vectors, dtype=np.float64)
+
+
+def _dense_rows(vectors, indices):
+  rows = vectors[np.asarray(indices)]
+  if scipy.sparse.issparse(rows):
+    rows = rows.toarray()
+  return np.asarray(rows, dtype=np.float64)
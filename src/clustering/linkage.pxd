@@ -0,0 +1,17 @@
+from condensed_distances cimport CondensedDistances
+
+cdef class DisjointSet:
+  """
+    Disjoint sets over 0..n-1, with union by rank and path compression.
+  """
+
+  cdef int[::1] parent
+  cdef int[::1] rank
+  cdef public int nbr_sets
+
+  cpdef int find(self, int i)
+
+  cpdef bint union(self, int left, int right)
+
+
+cpdef tuple average_linkage(CondensedDistances distances)
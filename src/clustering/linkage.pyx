@@ -0,0 +1,233 @@
+import numpy as np
+cimport numpy as np
+
+INTTYPE = np.int32
+
+# Blocks of the Q-matrix in neighbour joining are kept below this many values
+MAX_BLOCK_VALUES = 2**22
+
+from condensed_distances cimport CondensedDistances
+
+
+cdef class DisjointSet:
+  """
+    Disjoint sets over 0..n-1, with union by rank and path compression, so that
+    any sequence of m finds and unions costs O(m α(n)).
+  """
+
+  def __cinit__(self, int size):
+    self.parent = np.arange(size, dtype=INTTYPE)
+    self.rank = np.zeros(size, dtype=INTTYPE)
+    self.nbr_sets = size
+
+  cpdef int find(self, int i):
+    cdef int root = i
+    while self.parent[root] != root:
+      root = self.parent[root]
+    # Point the whole path directly to the root
+    cdef int next_i
+    while self.parent[i] != root:
+      next_i = self.parent[i]
+      self.parent[i] = root
+      i = next_i
+    return root
+
+  cpdef bint union(self, int left, int right):
+    """
+      Joins the sets of left and right, returns False if they already were the same set.
+    """
+    left = self.find(left)
+    right = self.find(right)
+    if left == right:
+      return False
+    if self.rank[left] < self.rank[right]:
+      left, right = right, left
+    self.parent[right] = left
+    if self.rank[left] == self.rank[right]:
+      self.rank[left] += 1
+    self.nbr_sets -= 1
+    return True
+
+  def labels(self):
+    """
+      The set of every item, numbered 0..nbr_sets-1 in order of first occurrence.
+    """
+    roots = np.array([self.find(i) for i in range(len(self.parent))], dtype=INTTYPE)
+    _, first_occurrence, labels = np.unique(roots, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first_occurrence))
+    return order[labels].astype(INTTYPE)
+
+
+cdef inline Py_ssize_t _condensed_index(Py_ssize_t n, Py_ssize_t i, Py_ssize_t j):
+  if i > j:
+    i, j = j, i
+  return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+cpdef tuple average_linkage(CondensedDistances distances):
+  """
+    Average linkage with the nearest-neighbour chain algorithm, O(n²) time on a copy of
+    the condensed distances.  Returns the merges sorted by distance, as arrays
+    (left, right, distance) where left and right are the smallest members of the two
+    merged clusters.
+  """
+  cdef Py_ssize_t n = distances.size
+  cdef double[::1] d = distances.values.astype(np.float64)
+  cdef int[::1] cluster_size = np.ones(n, dtype=INTTYPE)
+  cdef int[::1] smallest_member = np.arange(n, dtype=INTTYPE)
+  cdef np.uint8_t[::1] active = np.ones(n, dtype=np.uint8)
+  cdef int[::1] chain = np.zeros(n, dtype=INTTYPE)
+  cdef Py_ssize_t chain_length = 0
+
+  merge_left = np.zeros(max(n - 1, 0), dtype=INTTYPE)
+  merge_right = np.zeros(max(n - 1, 0), dtype=INTTYPE)
+  merge_distances = np.zeros(max(n - 1, 0), dtype=np.float64)
+  cdef int[::1] left_view = merge_left
+  cdef int[::1] right_view = merge_right
+  cdef double[::1] distances_view = merge_distances
+
+  cdef Py_ssize_t step, i, x, y, nearest
+  cdef Py_ssize_t first_active = 0
+  cdef double min_distance, distance
+  for step in range(n - 1):
+    if chain_length == 0:
+      while not active[first_active]:
+        first_active += 1
+      chain[0] = first_active
+      chain_length = 1
+
+    # Follow nearest neighbours until two clusters are each other's nearest neighbour
+    while True:
+      x = chain[chain_length - 1]
+      # On ties, prefer the previous cluster in the chain, so the chain always ends
+      nearest = -1
+      min_distance = np.inf
+      if chain_length > 1:
+        nearest = chain[chain_length - 2]
+        min_distance = d[_condensed_index(n, x, nearest)]
+      for i in range(n):
+        if active[i] and i != x:
+          distance = d[_condensed_index(n, x, i)]
+          if distance < min_distance or nearest == -1:
+            min_distance = distance
+            nearest = i
+      if chain_length > 1 and nearest == chain[chain_length - 2]:
+        break
+      chain[chain_length] = nearest
+      chain_length += 1
+
+    chain_length -= 2
+    y = nearest
+    left_view[step] = min(smallest_member[x], smallest_member[y])
+    right_view[step] = max(smallest_member[x], smallest_member[y])
+    distances_view[step] = min_distance
+
+    # The merged cluster takes the place of y, the distances are size-weighted averages
+    for i in range(n):
+      if active[i] and i != x and i != y:
+        d[_condensed_index(n, y, i)] = (
+            cluster_size[x] * d[_condensed_index(n, x, i)] +
+            cluster_size[y] * d[_condensed_index(n, y, i)]) / (cluster_size[x] + cluster_size[y])
+    active[x] = 0
+    cluster_size[y] += cluster_size[x]
+    smallest_member[y] = min(smallest_member[x], smallest_member[y])
+
+  # The chain finds merges out of order, average linkage is reducible so sorting them
+  # gives the same merges as always merging the two closest clusters
+  order = np.argsort(merge_distances, kind='mergesort')
+  return merge_left[order], merge_right[order], merge_distances[order]
+
+
+def linkage_matrix(merge_left, merge_right, merge_distances, size):
+  """
+    The merges as a scipy linkage matrix: every row holds the ids of the two merged
+    clusters, their distance and the size of the new cluster, which gets id size + row.
+  """
+  cdef DisjointSet clusters = DisjointSet(size)
+  cluster_ids = np.arange(size)
+  cluster_sizes = np.ones(size, dtype=INTTYPE)
+  z = np.zeros([len(merge_distances), 4], dtype=np.float64)
+  for i, (left, right, distance) in enumerate(zip(merge_left, merge_right, merge_distances)):
+    left_root, right_root = clusters.find(left), clusters.find(right)
+    merged_size = cluster_sizes[left_root] + cluster_sizes[right_root]
+    z[i] = [min(cluster_ids[left_root], cluster_ids[right_root]),
+            max(cluster_ids[left_root], cluster_ids[right_root]), distance, merged_size]
+    clusters.union(left, right)
+    root = clusters.find(left)
+    cluster_ids[root] = size + i
+    cluster_sizes[root] = merged_size
+  return z
+
+
+def cluster_labels(merge_left, merge_right, size, nbr_merges):
+  """
+    The cluster of every item after the first nbr_merges merges.
+  """
+  cdef DisjointSet clusters = DisjointSet(size)
+  for left, right in zip(merge_left[:nbr_merges], merge_right[:nbr_merges]):
+    clusters.union(left, right)
+  return clusters.labels()
+
+
+def neighbour_joining(CondensedDistances distances):
+  """
+    Neighbour joining on a shrinking float32 square matrix, with the row sums kept up to
+    date so that every step is one vectorised O(m²) evaluation of the Q-matrix, O(n³) in
+    total.  The Q-matrix is evaluated in blocks of rows, so no m x m array is made besides
+    the distances.  Returns the merges in the order they are made, as arrays (left, right, q)
+    where left and right are the smallest members of the two joined clusters and q is
+    their Q-distance.
+  """
+  n = distances.size
+  d = distances.square()
+  row_sums = d.sum(axis=1, dtype=np.float64)
+  smallest_member = np.arange(n, dtype=INTTYPE)
+
+  merge_left = np.zeros(max(n - 1, 0), dtype=INTTYPE)
+  merge_right = np.zeros(max(n - 1, 0), dtype=INTTYPE)
+  merge_q = np.zeros(max(n - 1, 0), dtype=np.float64)
+  for step in range(n - 1):
+    m = len(d)
+    i, j, merge_q[step] = _minimum_q_distance(d, row_sums)
+    merge_left[step] = min(smallest_member[i], smallest_member[j])
+    merge_right[step] = max(smallest_member[i], smallest_member[j])
+
+    # The joined cluster takes the place of i
+    new_distances = (d[i] + d[j] - d[i, j]) * np.float32(0.5)
+    new_distances[i] = 0
+    row_sums += new_distances.astype(np.float64) - d[:, i] - d[:, j]
+    d[i, :] = new_distances
+    d[:, i] = new_distances
+    row_sums[i] = new_distances.sum(dtype=np.float64) - new_distances[j]
+    smallest_member[i] = min(smallest_member[i], smallest_member[j])
+
+    # and the last cluster takes the place of j
+    last = m - 1
+    d[j, :] = d[last, :]
+    d[:, j] = d[:, last]
+    d[j, j] = 0
+    row_sums[j] = row_sums[last]
+    smallest_member[j] = smallest_member[last]
+    d = d[:last, :last]
+    row_sums = row_sums[:last]
+
+  return merge_left, merge_right, merge_q
+
+
+def _minimum_q_distance(d, row_sums):
+  """
+    The pair (i, j), i != j, with the smallest Q-distance (m - 2) d(i, j) - r(i) - r(j), and
+    that distance.  Ties go to the first pair in row-major order.
+  """
+  m = len(d)
+  block_size = max(1, MAX_BLOCK_VALUES // m)
+  minimum = (np.inf, 0, 1)
+  for start in range(0, m, block_size):
+    end = min(start + block_size, m)
+    q = (m - 2) * d[start:end].astype(np.float64) - row_sums[start:end, None] - row_sums[None, :]
+    q[np.arange(end - start), np.arange(start, end)] = np.inf
+    block_minimum = np.argmin(q)
+    if q.flat[block_minimum] < minimum[0]:
+      minimum = (q.flat[block_minimum], start + block_minimum // m, block_minimum % m)
+  q_distance, i, j = minimum
+  return i, j, q_distance
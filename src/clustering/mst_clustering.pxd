@@ -9,8 +9,5 @@ cdef class MSTClustering(GraphBasedClustering):
     Super class for mst graph-based clustering methods.
   """
 
-  cdef dict clustering
-
   cdef void _cluster(self, num_clusters, distances)
-  cdef void _create_mst(self, sorted_distances, connections_to_make)
-  cdef tuple _find_smallest_unconnected_edge(self, sorted_distances, smallest_distance_index)
+  cdef void _create_mst(self)
@@ -6,8 +6,4 @@ from graph_based_clustering cimport GraphBasedClustering
 
 
 cdef class NeighbourJoining(GraphBasedClustering):
-  cdef dict neighbour_distances
-  cdef set clusters
-
-  cdef double _q_distance(self, left, right)
-  cdef double _new_dist(self, left_dist, right_dist, last_dist)
+  pass
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import squareform
+
+from vlmc import VLMC
+
+
+class LookupDistance(object):
+  """
+    Distances between the vlmcs looked up in a square matrix, by name.
+  """
+  symmetric = True
+
+  def __init__(self, vlmcs, square):
+    self.index = {vlmc.name: i for i, vlmc in enumerate(vlmcs)}
+    self.square = square
+
+  def __repr__(self):
+    return "LookupDistance({})".format(len(self.index))
+
+  def distance(self, left, right):
+    return self.square[self.index[left.name], self.index[right.name]]
+
+
+@pytest.fixture
+def clustering_input():
+  """
+    60 vlmcs with random distances between them and random metadata, as the arguments
+    (vlmcs, d, metadata) of the clustering classes.
+  """
+  rng = np.random.default_rng(7)
+  nbr_vlmcs = 60
+  vlmcs = [VLMC({"": {"A": 0.25, "C": 0.25, "G": 0.25, "T": 0.25}}, "vlmc_{}".format(i), {})
+           for i in range(nbr_vlmcs)]
+  square = squareform(rng.random(nbr_vlmcs * (nbr_vlmcs - 1) // 2).astype(np.float32))
+  metadata = {vlmc.name: {'organism': 'organism_{}'.format(rng.integers(30)),
+                          'family': 'family_{}'.format(rng.integers(4)),
+                          'genus': 'genus_{}'.format(rng.integers(8))}
+              for vlmc in vlmcs}
+  return vlmcs, LookupDistance(vlmcs, square), metadata
+
+
+def same_partition(labels, other_labels):
+  """
+    Whether both labellings group the vlmcs the same way, whatever the cluster numbers.
+  """
+  nbr_clusters = len(set(labels))
+  return nbr_clusters == len(set(other_labels)) == len(set(zip(labels, other_labels)))
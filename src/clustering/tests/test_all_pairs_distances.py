@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from clustering import calculate_distances_within_vlmcs
+from distance import FrobeniusNorm
+
+
+class ContextCountDifference(object):
+  """
+    An asymmetric distance without pairwise_distances, to go through the pair by pair path.
+  """
+
+  def distance(self, left, right):
+    return len(left.contexts) - 0.5 * len(right.contexts)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_asymmetric_distances_are_averaged(vlmcs, processes):
+  d = ContextCountDifference()
+  distances = calculate_distances_within_vlmcs(vlmcs, d, processes).square()
+  for i, left in enumerate(vlmcs):
+    for j, right in enumerate(vlmcs):
+      if i != j:
+        assert np.isclose(distances[i, j], (d.distance(left, right) + d.distance(right, left)) / 2)
+
+
+class PairByPair(object):
+  """
+    Hides the pairwise_distances of a distance function.
+  """
+  symmetric = True
+
+  def __init__(self, d):
+    self.d = d
+
+  def distance(self, left, right):
+    return self.d.distance(left, right)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_pairwise_distances_match_pair_by_pair(vlmcs, processes):
+  pairwise_distances = calculate_distances_within_vlmcs(vlmcs, FrobeniusNorm(), processes)
+  distances = calculate_distances_within_vlmcs(vlmcs, PairByPair(FrobeniusNorm()), processes)
+  assert np.allclose(pairwise_distances.values, distances.values, rtol=1e-5, atol=1e-6)
+  for i in range(len(vlmcs)):
+    for j in range(i + 1, len(vlmcs)):
+      assert np.isclose(distances[i, j], FrobeniusNorm().distance(vlmcs[i], vlmcs[j]))
+
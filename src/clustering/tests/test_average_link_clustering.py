@@ -0,0 +1,27 @@
+import numpy as np
+from scipy.cluster.hierarchy import average, fcluster
+from scipy.spatial.distance import squareform
+
+from clustering import AverageLinkClustering, CondensedDistances
+from clustering.linkage import average_linkage, linkage_matrix
+
+from .conftest import same_partition
+
+
+def test_average_linkage_is_scipys_average_linkage():
+  rng = np.random.default_rng(3)
+  for size in [2, 3, 50, 200]:
+    values = rng.random(size * (size - 1) // 2).astype(np.float32)
+    merge_left, merge_right, merge_distances = average_linkage(CondensedDistances(values, size))
+    assert np.allclose(linkage_matrix(merge_left, merge_right, merge_distances, size),
+                       average(values.astype(np.float64)))
+
+
+def test_average_link_clustering_cuts_the_average_linkage(clustering_input):
+  vlmcs, d, metadata = clustering_input
+  clustering = AverageLinkClustering(vlmcs, d, metadata)
+  average_linkage_matrix = average(squareform(d.square, checks=False).astype(np.float64))
+  for nbr_clusters in [30, 5, 2, 12]:
+    metrics = clustering.cluster(nbr_clusters)
+    assert metrics.nbr_clusters == nbr_clusters
+    assert same_partition(metrics.labels, fcluster(average_linkage_matrix, nbr_clusters, 'maxclust'))
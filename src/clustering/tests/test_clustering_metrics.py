@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from clustering import ClusteringMetrics, CondensedDistances, clustering_metrics
+
+
+def random_metrics(clustering_input, nbr_clusters):
+  vlmcs, d, metadata = clustering_input
+  labels = np.random.default_rng(nbr_clusters).integers(nbr_clusters, size=len(vlmcs))
+  distances = CondensedDistances.from_square(d.square)
+  return ClusteringMetrics(labels, distances.mean(), distances, vlmcs, metadata, []), d.square
+
+
+def reference_silhouettes(labels, square):
+  silhouettes = []
+  for i in range(len(labels)):
+    own = (labels == labels[i]) & (np.arange(len(labels)) != i)
+    own_average = square[i, own].mean() if np.any(own) else 0
+    other_average = min(square[i, labels == label].mean() for label in set(labels) if label != labels[i])
+    silhouettes.append((other_average - own_average) / max(other_average, own_average))
+  return np.array(silhouettes)
+
+
+@pytest.mark.parametrize('max_block_values', [2**22, 100])
+def test_silhouettes_match_the_definition(clustering_input, monkeypatch, max_block_values):
+  monkeypatch.setattr(clustering_metrics, 'MAX_BLOCK_VALUES', max_block_values)
+  for nbr_clusters in [2, 7, 40]:
+    metrics, square = random_metrics(clustering_input, nbr_clusters)
+    expected = reference_silhouettes(metrics.labels, square.astype(np.float64))
+    assert np.allclose(list(metrics.silhouette_metric().values()), expected)
+    assert np.isclose(metrics.average_silhouette(), expected.mean())
+
+
+def test_labels_are_numbered_by_first_vlmc(clustering_input):
+  metrics, _ = random_metrics(clustering_input, 7)
+  first_vlmcs = [cluster[0] for cluster in metrics.cluster_indices()]
+  assert first_vlmcs == sorted(first_vlmcs)
+  assert np.array_equal(metrics.cluster_sizes(), [len(cluster) for cluster in metrics.clusters()])
+
+
+def test_taxonomy_metrics_match_counting_pairs(clustering_input):
+  vlmcs, _, metadata = clustering_input
+  metrics, _ = random_metrics(clustering_input, 7)
+  families = [metadata[vlmc.name]['family'] for vlmc in vlmcs]
+  pairs = [(metrics.labels[i] == metrics.labels[j], families[i] == families[j])
+           for i in range(len(vlmcs)) for j in range(len(vlmcs)) if i != j]
+  true_positives = sum(same_cluster and same_family for same_cluster, same_family in pairs)
+  false_positives = sum(same_cluster and not same_family for same_cluster, same_family in pairs)
+  true_negatives = sum(not same_cluster and not same_family for same_cluster, same_family in pairs)
+  false_negatives = sum(not same_cluster and same_family for same_cluster, same_family in pairs)
+  assert metrics.pair_counts('family') == (true_positives, false_positives, true_negatives, false_negatives)
+  assert np.allclose(metrics.sensitivity_specificity('family'),
+                     (true_positives / (true_positives + false_negatives),
+                      true_positives / (true_positives + false_positives)))
+
+  percents = [sum(families[i] == families[j] for i in cluster for j in cluster) / len(cluster) ** 2 * len(cluster)
+              for cluster in metrics.cluster_indices()]
+  assert np.isclose(metrics.average_percent_same_taxonomy('family'), sum(percents) / len(vlmcs))
@@ -0,0 +1,45 @@
+import numpy as np
+from scipy.spatial.distance import squareform
+
+from clustering import CondensedDistances
+from clustering.condensed_distances import condensed_index_to_pair
+
+
+def random_distances(size, seed=0):
+  rng = np.random.default_rng(seed)
+  # Few distinct values, so that the sorting has ties
+  return CondensedDistances(rng.integers(0, 20, size * (size - 1) // 2), size)
+
+
+def test_condensed_order_is_squareform():
+  distances = random_distances(30)
+  square = squareform(distances.values)
+  assert np.array_equal(distances.square(), square)
+  assert np.array_equal(CondensedDistances.from_square(square).values, distances.values)
+  for start, end in [(0, 30), (0, 1), (7, 19), (29, 30)]:
+    assert np.array_equal(distances.rows(start, end), square[start:end])
+  for i in range(30):
+    assert np.array_equal(distances.row(i), square[i])
+    for j in range(30):
+      assert distances[i, j] == square[i, j]
+
+
+def test_asymmetric_squares_are_averaged():
+  matrix = np.arange(16, dtype=np.float32).reshape(4, 4)
+  assert np.array_equal(CondensedDistances.from_square(matrix).square(), (matrix + matrix.T) / 2 * (1 - np.eye(4)))
+
+
+def test_index_to_pair_inverts_index():
+  for size in [2, 3, 17, 300]:
+    distances = random_distances(size)
+    left, right = condensed_index_to_pair(np.arange(len(distances.values)), size)
+    assert np.all(left < right)
+    assert np.array_equal([distances.index(i, j) for i, j in zip(left, right)], np.arange(len(left)))
+
+
+def test_sorted_edges_are_the_sorted_triplets():
+  distances = random_distances(40)
+  left, right, sorted_distances = distances.sorted_edges()
+  triplets = sorted(((distances[i, j], i, j) for i in range(40) for j in range(i + 1, 40)))
+  assert np.array_equal(sorted_distances, [d for d, _, _ in triplets])
+  assert [(i, j) for _, i, j in triplets] == list(zip(left, right))
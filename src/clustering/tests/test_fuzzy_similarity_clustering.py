@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from clustering import CondensedDistances, fuzzy_similarity_clustering
+from clustering.fuzzy_similarity_clustering import fuzzy_similarity_measures, nearest_neighbours
+
+
+def random_distances(size):
+  rng = np.random.default_rng(size)
+  # Few distinct values, so that there are ties between the neighbours
+  return CondensedDistances(rng.integers(0, 10, size * (size - 1) // 2) - 3.5, size)
+
+
+def reference_fuzzy_similarity_measures(square, k, rmax, alpha):
+  """
+    F_r = (1 - alpha) F_r-1 + alpha s_r pair by pair, with the neighbours from sorting every row.
+  """
+  size = len(square)
+  neighbours = np.argsort(square, axis=1, kind='stable')
+  fuzzy_similarity_measures = np.zeros([size, size])
+  for r in range(1, rmax + 1):
+    for i in range(size):
+      for j in range(size):
+        shared = len(set(neighbours[i, :k * r]) & set(neighbours[j, :k * r]))
+        fuzzy_similarity_measures[i, j] = ((1 - alpha) * fuzzy_similarity_measures[i, j]
+                                           - alpha * shared / (2 * k * r - shared))
+  return fuzzy_similarity_measures
+
+
+@pytest.mark.parametrize('max_block_values', [2**22, 50])
+def test_nearest_neighbours_are_a_stable_sort(monkeypatch, max_block_values):
+  monkeypatch.setattr(fuzzy_similarity_clustering, 'MAX_BLOCK_VALUES', max_block_values)
+  for size in [1, 2, 40]:
+    distances = random_distances(size)
+    expected = np.argsort(distances.square(), axis=1, kind='stable')
+    for nbr_neighbours in [0, 1, size // 2, size]:
+      assert np.array_equal(nearest_neighbours(distances, nbr_neighbours), expected[:, :nbr_neighbours])
+
+
+@pytest.mark.parametrize('max_block_values', [2**22, 50])
+def test_fuzzy_similarity_measures_match_the_definition(monkeypatch, max_block_values):
+  monkeypatch.setattr(fuzzy_similarity_clustering, 'MAX_BLOCK_VALUES', max_block_values)
+  distances = random_distances(30)
+  measures = fuzzy_similarity_measures(distances, 2, 4, 0.1)
+  expected = reference_fuzzy_similarity_measures(distances.square(), 2, 4, 0.1)
+  assert np.allclose(measures.square(), expected * (1 - np.eye(30)), rtol=1e-5, atol=1e-7)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+from clustering import KMeans
+from clustering.k_means import assign_to_centroids, update_centroids, k_means_plus_plus, _lloyd, _squared_norms
+from distance import Projection
+
+
+def random_vectors(sparse):
+  rng = np.random.default_rng(5)
+  vectors = rng.random([120, 30]) * (rng.random([120, 30]) < 0.3)
+  return scipy.sparse.csr_matrix(vectors) if sparse else vectors
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_assignment_and_update_match_the_definitions(sparse):
+  vectors = random_vectors(sparse)
+  dense_vectors = vectors.toarray() if sparse else vectors
+  centroids = dense_vectors[[3, 50, 90, 7]].copy()
+  labels, min_squared_distances = assign_to_centroids(vectors, _squared_norms(vectors), centroids)
+
+  squared_distances = ((dense_vectors[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+  assert np.array_equal(labels, np.argmin(squared_distances, axis=1))
+  assert np.allclose(min_squared_distances, squared_distances.min(axis=1))
+
+  new_centroids = update_centroids(vectors, labels, centroids)
+  for cluster in range(len(centroids)):
+    assert np.allclose(new_centroids[cluster], dense_vectors[labels == cluster].mean(axis=0))
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_lloyd_stops_at_a_fixed_point(sparse):
+  vectors = random_vectors(sparse)
+  squared_norms = _squared_norms(vectors)
+  centroids = k_means_plus_plus(vectors, squared_norms, 5, np.random.default_rng(0))
+  labels, centroids = _lloyd(vectors, squared_norms, centroids, 300)
+  assert np.array_equal(assign_to_centroids(vectors, squared_norms, centroids)[0], labels)
+  assert np.allclose(update_centroids(vectors, labels, centroids), centroids)
+
+
+def test_restarts_are_the_same_in_every_process(vlmcs):
+  metadata = {vlmc.name: {} for vlmc in vlmcs}
+  labels = [KMeans(vlmcs, Projection(), metadata, processes, restarts=4, seed=1).cluster(3).labels
+            for processes in [1, 2]]
+  assert np.array_equal(labels[0], labels[1])
+  assert len(set(labels[0])) == 3
@@ -0,0 +1,19 @@
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, single
+from scipy.spatial.distance import squareform
+
+from clustering import MSTClustering
+
+from .conftest import same_partition
+
+
+def test_mst_clustering_is_single_linkage(clustering_input):
+  vlmcs, d, metadata = clustering_input
+  clustering = MSTClustering(vlmcs, d, metadata)
+  single_linkage = single(squareform(d.square, checks=False).astype(np.float64))
+  assert np.allclose(clustering.linkage_matrix()[:, 2], single_linkage[:, 2])
+  # Fewer clusters first, and then more, which starts the merges over
+  for nbr_clusters in [30, 5, 2, 12]:
+    metrics = clustering.cluster(nbr_clusters)
+    assert metrics.nbr_clusters == nbr_clusters
+    assert same_partition(metrics.labels, fcluster(single_linkage, nbr_clusters, 'maxclust'))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from clustering import CondensedDistances, linkage
+from clustering.linkage import neighbour_joining
+
+
+def reference_neighbour_joining(square):
+  """
+    Neighbour joining as the original implementation, recomputing every Q-distance
+    from the distances between the clusters.
+  """
+  distances = {(i,): {(j,): float(square[i, j]) for j in range(len(square)) if j != i}
+               for i in range(len(square))}
+  merges = []
+  while len(distances) > 1:
+    m = len(distances)
+    row_sums = {c: sum(others.values()) for c, others in distances.items()}
+    q, left, right = min(((m - 2) * distances[left][right] - row_sums[left] - row_sums[right], left, right)
+                         for left in distances for right in distances if left != right)
+    merges.append((min(min(left), min(right)), max(min(left), min(right)), q))
+
+    joined = left + right
+    joined_distances = {c: (distances[left][c] + distances[right][c] - distances[left][right]) * 0.5
+                        for c in distances if c not in (left, right)}
+    del distances[left], distances[right]
+    for c, distance in joined_distances.items():
+      del distances[c][left], distances[c][right]
+      distances[c][joined] = distance
+    distances[joined] = joined_distances
+  return merges
+
+
+@pytest.mark.parametrize('max_block_values', [2**22, 7])
+def test_neighbour_joining_matches_reference(monkeypatch, max_block_values):
+  monkeypatch.setattr(linkage, 'MAX_BLOCK_VALUES', max_block_values)
+  rng = np.random.default_rng(11)
+  for size in [2, 3, 25]:
+    values = rng.random(size * (size - 1) // 2).astype(np.float32)
+    distances = CondensedDistances(values, size)
+    merge_left, merge_right, merge_q = neighbour_joining(distances)
+    expected = reference_neighbour_joining(distances.square().astype(np.float64))
+    assert list(zip(merge_left, merge_right)) == [(left, right) for left, right, _ in expected]
+    assert np.allclose(merge_q, [q for _, _, q in expected], rtol=1e-5, atol=1e-5)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from clustering import AverageLinkClustering, ClusteringMetrics, CondensedDistances, clustering_metrics, silhouette_sweep
+from clustering.linkage import average_linkage, cluster_labels
+
+
+def random_merges(size, rng):
+  """
+    Merges of random pairs, some of which are already in the same cluster.
+  """
+  return rng.integers(size, size=3 * size), rng.integers(size, size=3 * size)
+
+
+@pytest.mark.parametrize('nbr_candidates, max_block_values', [(16, 2**22), (1, 100), (3, 7)])
+def test_silhouette_sweep_matches_the_metrics_of_every_cut(clustering_input, monkeypatch,
+                                                          nbr_candidates, max_block_values):
+  # Few candidates are often all merged away, so the closest clusters are searched again
+  monkeypatch.setattr(clustering_metrics, 'NBR_CLOSEST_CANDIDATES', nbr_candidates)
+  monkeypatch.setattr(clustering_metrics, 'MAX_BLOCK_VALUES', max_block_values)
+  vlmcs, d, metadata = clustering_input
+  distances = CondensedDistances.from_square(d.square)
+  average_left, average_right, _ = average_linkage(distances)
+  for merge_left, merge_right in [(average_left, average_right),
+                                  random_merges(len(vlmcs), np.random.default_rng(2))]:
+    silhouettes = silhouette_sweep(distances, merge_left, merge_right)
+    reached = set()
+    for nbr_merges in range(len(merge_left) + 1):
+      labels = cluster_labels(merge_left, merge_right, len(vlmcs), nbr_merges)
+      nbr_clusters = len(set(labels))
+      if nbr_clusters in reached:
+        continue
+      reached.add(nbr_clusters)
+      metrics = ClusteringMetrics(labels, distances.mean(), distances, vlmcs, metadata, [])
+      assert np.isclose(silhouettes[nbr_clusters], metrics.average_silhouette(), equal_nan=True)
+    assert all(np.isnan(silhouettes[k]) for k in range(len(vlmcs) + 1) if k not in reached)
+
+
+def test_sweep_matches_clustering_every_number_of_clusters(clustering_input):
+  vlmcs, d, metadata = clustering_input
+  clustering = AverageLinkClustering(vlmcs, d, metadata)
+  sweep = clustering.sweep()
+  for nbr_clusters in range(len(vlmcs), 0, -1):
+    metrics = clustering.cluster(nbr_clusters)
+    assert np.isclose(sweep['silhouette'][nbr_clusters], metrics.average_silhouette(), equal_nan=True)
+    for taxonomy in ['organism', 'family', 'genus']:
+      assert np.isclose(sweep['percent_' + taxonomy][nbr_clusters],
+                        metrics.average_percent_same_taxonomy(taxonomy))
+    if nbr_clusters < len(vlmcs):
+      # Without pairs in the same cluster, the precision is NaN in the sweep
+      assert np.allclose([sweep['sensitivity'][nbr_clusters], sweep['precision'][nbr_clusters]],
+                         metrics.sensitivity_specificity('family'))
+    assert np.isclose(sweep['merge_distance'][nbr_clusters], metrics.get_latest_merge_distance())
@@ -1,33 +1,177 @@
+import multiprocessing
+import time
 import numpy as np
 cimport numpy as np
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
 
-cpdef public np.ndarray[FLOATTYPE_t, ndim = 2] calculate_distances_within_vlmcs(vlmcs, d):
+from condensed_distances cimport CondensedDistances
+from condensed_distances import CondensedDistances
+from distance_store import DistanceStore
+
+# Blocks are kept below this many distances, batched distance functions hold a block in memory
+MAX_BLOCK_DISTANCES = 2**24
+
+# Set in every worker process, so the vlmcs are shipped once per worker instead of once per task.
+_worker_vlmcs = None
+_worker_distance_function = None
+
+
+cpdef CondensedDistances calculate_distances_within_vlmcs(vlmcs, d, processes=1, directory=None):
+  """
+    Calculates the distances between all vlmcs, each pair once.  If the distance function is
+    not symmetric (has no symmetric = True), both d(i, j) and d(j, i) are calculated and
+    stored as their average.
+    The rows are split into blocks of roughly equal work, which are spread over a process pool.
+    With a directory, the distances are kept in a DistanceStore there: only the rows of vlmcs
+    that are new to the store are calculated, against every vlmc in it, and every finished
+    block is written to disk.
+  """
   cdef int num_vlmcs = len(vlmcs)
-  cdef int num_distances = num_vlmcs * (num_vlmcs)
-  cdef np.ndarray[FLOATTYPE_t, ndim = 2] distances = np.zeros([num_distances, 3], dtype=FLOATTYPE)
-  cdef FLOATTYPE_t dist, left_i_t, right_i_t
+  if directory is None:
+    values = np.zeros(num_vlmcs * (num_vlmcs - 1) // 2, dtype=FLOATTYPE)
+    _calculate_rows(vlmcs, d, values, np.zeros(num_vlmcs, dtype=bool), False, processes)
+    return CondensedDistances(values, num_vlmcs)
+
+  store = DistanceStore(directory, d)
+  entry_vlmcs, indices = store.update(vlmcs)
+  _calculate_rows(entry_vlmcs, d, store.values, store.computed_rows, True, processes, store)
+  return store.condensed_distances(indices)
+
+
+def _calculate_rows(vlmcs, d, values, computed_rows, lower, processes, store=None):
+  """
+    Fills in the rows that are not computed yet, of the upper triangle (scipy's condensed
+    order, row i holds the distances to j > i) or the lower triangle (row i holds the
+    distances to j < i).  A vlmc that is None has only nan distances.
+  """
+  num_vlmcs = len(vlmcs)
+  cdef bint symmetric = getattr(d, 'symmetric', False)
+  row_lengths = _row_lengths(num_vlmcs, lower)
+  rows = np.flatnonzero(~computed_rows)
+  if len(rows) == 0:
+    return
+  blocks = _row_blocks(rows, row_lengths, symmetric, lower, processes)
+  total_distances = int(np.sum(row_lengths[rows]))
+
+  start_time = time.time()
+  calculated_distances = 0
+  if processes > 1:
+    with multiprocessing.Pool(processes, initializer=_initialise_worker, initargs=(vlmcs, d)) as pool:
+      for row_start, row_end, block_distances in pool.imap_unordered(_distance_block, blocks):
+        _store_block(values, computed_rows, store, row_start, row_end, block_distances, row_lengths)
+        calculated_distances += len(block_distances)
+        _report_progress(calculated_distances, total_distances, start_time)
+  else:
+    _initialise_worker(vlmcs, d)
+    for block in blocks:
+      row_start, row_end, block_distances = _distance_block(block)
+      _store_block(values, computed_rows, store, row_start, row_end, block_distances, row_lengths)
+      calculated_distances += len(block_distances)
+      _report_progress(calculated_distances, total_distances, start_time)
+
+
+cdef void _store_block(values, computed_rows, store, row_start, row_end, block_distances, row_lengths) except *:
+  # The distances of a block of rows are a contiguous part of the triangle
+  start = int(np.sum(row_lengths[:row_start]))
+  values[start:start + len(block_distances)] = block_distances
+  # The rows are marked only after their distances are on disk, to be able to resume
+  if store is not None:
+    store.flush()
+  computed_rows[row_start:row_end] = True
+  if store is not None:
+    store.flush()
+
+
+def _initialise_worker(vlmcs, d):
+  global _worker_vlmcs, _worker_distance_function
+  _worker_vlmcs = vlmcs
+  _worker_distance_function = d
+
+
+def _distance_block(block):
+  """
+    The distances of the rows, one row after the other.
+  """
+  row_start, row_end, symmetric, lower = block
+  if hasattr(_worker_distance_function, 'pairwise_distances'):
+    return row_start, row_end, _pairwise_distance_block(row_start, row_end, symmetric, lower)
+
+  num_vlmcs = len(_worker_vlmcs)
+  row_lengths = _row_lengths(num_vlmcs, lower)
+  block_distances = np.zeros(int(np.sum(row_lengths[row_start:row_end])), dtype=FLOATTYPE)
   distances_index = 0
-  for left_i, left in enumerate(vlmcs):
-    for right_i, right in enumerate(vlmcs):
-      dist = d.distance(left, right)
-      left_i_t = left_i
-      right_i_t = right_i
-      distances[distances_index, 0] = left_i_t
-      distances[distances_index, 1] = right_i_t
-      distances[distances_index, 2] = dist
+  for left_i in range(row_start, row_end):
+    left = _worker_vlmcs[left_i]
+    for right_i in (range(left_i) if lower else range(left_i + 1, num_vlmcs)):
+      right = _worker_vlmcs[right_i]
+      if left is None or right is None:
+        block_distances[distances_index] = np.nan
+      elif symmetric:
+        block_distances[distances_index] = _worker_distance_function.distance(left, right)
+      else:
+        block_distances[distances_index] = (_worker_distance_function.distance(left, right) +
+                                            _worker_distance_function.distance(right, left)) / 2
       distances_index += 1
-  return distances
-
-cpdef public np.ndarray[FLOATTYPE_t, ndim = 2] index_distances(vlmcs, distances):
-  indexed_distances = np.ndarray([len(vlmcs), len(vlmcs)], dtype=FLOATTYPE)
-  cdef int left_i, right_i
-  cdef FLOATTYPE_t dist = -1.0
-  for column in distances:
-    left_i = column[0]
-    right_i = column[1]
-    dist = column[2]
-    indexed_distances[left_i, right_i] = dist
-
-  return indexed_distances
+  return row_start, row_end, block_distances
+
+
+def _pairwise_distance_block(row_start, row_end, symmetric, lower):
+  """
+    For distance functions with a batched pairwise_distances(left_vlmcs, right_vlmcs),
+    the distances between the rows and every column they need, in one call.
+  """
+  num_vlmcs = len(_worker_vlmcs)
+  rows = np.arange(row_start, row_end)
+  columns = np.arange(0, row_end - 1) if lower else np.arange(row_start + 1, num_vlmcs)
+  block = np.full([len(rows), len(columns)], np.nan)
+
+  valid_rows = np.array([i for i in rows if _worker_vlmcs[i] is not None], dtype=np.intp)
+  valid_columns = np.array([j for j in columns if _worker_vlmcs[j] is not None], dtype=np.intp)
+  if len(valid_rows) > 0 and len(valid_columns) > 0:
+    left_vlmcs = [_worker_vlmcs[i] for i in valid_rows]
+    right_vlmcs = [_worker_vlmcs[j] for j in valid_columns]
+    distances = _worker_distance_function.pairwise_distances(left_vlmcs, right_vlmcs)
+    if not symmetric:
+      distances = (distances + _worker_distance_function.pairwise_distances(right_vlmcs, left_vlmcs).T) / 2
+    block[np.ix_(valid_rows - row_start, valid_columns - columns[0])] = distances
+
+  # Row by row, the part of the block that is in the triangle
+  if lower:
+    in_triangle = columns[None, :] < rows[:, None]
+  else:
+    in_triangle = columns[None, :] > rows[:, None]
+  return block[in_triangle].astype(FLOATTYPE)
+
+
+def _row_lengths(num_vlmcs, lower):
+  if lower:
+    return np.arange(num_vlmcs)
+  return num_vlmcs - 1 - np.arange(num_vlmcs)
+
+
+def _row_blocks(rows, row_lengths, symmetric, lower, processes):
+  """
+    Splits the (sorted) rows into blocks of consecutive rows with about the same number of
+    distances in each, a few blocks per process so that the work is evened out, and none
+    larger than MAX_BLOCK_DISTANCES.
+  """
+  total_distances = np.sum(row_lengths[rows])
+  nbr_blocks = min(len(rows), max(4 * processes, -(-total_distances // MAX_BLOCK_DISTANCES), 1))
+  blocks = []
+  row_start = None
+  calculated_distances = 0
+  for row_i, row in enumerate(rows):
+    if row_start is None:
+      row_start = row
+    calculated_distances += row_lengths[row]
+    last_consecutive_row = row_i == len(rows) - 1 or rows[row_i + 1] != row + 1
+    if calculated_distances * nbr_blocks >= total_distances * (len(blocks) + 1) or last_consecutive_row:
+      blocks.append((row_start, row + 1, symmetric, lower))
+      row_start = None
+  return blocks
+
+
+def _report_progress(calculated_distances, total_distances, start_time):
+  print("Calculated {}/{} distances, {:.1f} s".format(
+      calculated_distances, total_distances, time.time() - start_time))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from vlmc import VLMC
+
+ALPHABET = 'ACGT'
+
+
+def random_tree(rng, nbr_contexts, max_order):
+  """
+    A random context tree, every context is its parent with one more character in front.
+    Some transitions are impossible, as in estimated trees.
+  """
+  def transitions():
+    weights = rng.random(len(ALPHABET))
+    if rng.random() < 0.2:
+      weights[rng.integers(len(ALPHABET))] = 0.0
+    return {char_: float(w) for char_, w in zip(ALPHABET, weights / weights.sum())}
+
+  tree = {"": transitions()}
+  frontier = [""]
+  while len(tree) < nbr_contexts:
+    context = ALPHABET[rng.integers(len(ALPHABET))] + frontier[rng.integers(len(frontier))]
+    if context in tree or len(context) > max_order:
+      continue
+    tree[context] = transitions()
+    frontier.append(context)
+  return tree
+
+
+@pytest.fixture
+def vlmcs():
+  rng = np.random.default_rng(1)
+  return [VLMC(random_tree(rng, rng.integers(5, 40), 5), "vlmc_{}".format(i), {})
+          for i in range(6)]
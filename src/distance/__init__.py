@@ -6,5 +6,6 @@ from .frobenius import FrobeniusNorm
 from .estimate import EstimateVLMC
 from .projection import Projection
 from .fixed_length_sequence_kl_divergence import FixedLengthSequenceKLDivergence
+from .kl_divergence_rate import KLDivergenceRate
 from .pstmatching import PSTMatching
 
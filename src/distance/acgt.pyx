@@ -5,10 +5,14 @@ cdef class ACGTContent(object):
   """
 
   cdef list characters
+  symmetric = True
 
   def __init__(self, characters=['A', 'C', 'G', 'T']):
     self.characters = characters
 
+  def __repr__(self):
+    return "ACGTContent({})".format(self.characters)
+
 
   cpdef double distance(self, left_vlmc, right_vlmc):
     # Assume this is the alphabet, only relevant case for us.
@@ -0,0 +1,13 @@
+cimport numpy as np
+
+cdef class ContextAlignment:
+  cdef public dict context_index
+  cdef public list contexts
+  cdef public np.ndarray context_lengths
+  cdef dict own_columns
+  cdef dict fallback_ids
+  cdef void _add_contexts(self, contexts)
+  cpdef np.ndarray context_columns(self, vlmc)
+  cdef np.ndarray _fallback_ids(self, vlmc)
+  cpdef np.ndarray columns(self, vlmcs)
+  cpdef tuple align(self, vlmcs, np.ndarray columns)
@@ -0,0 +1,75 @@
+import numpy as np
+cimport numpy as np
+
+
+cdef class ContextAlignment:
+  """
+    Aligns vlmcs to one index of every context seen so far.  For every vlmc, the id of
+    the context it falls back to is found once for every context of the index, through
+    its trie, and kept by fingerprint.  As in Projection, the index only ever grows, so
+    the fallback ids of a vlmc are only extended with the contexts added since.
+  """
+
+  def __cinit__(self):
+    self.context_index = {}
+    self.contexts = []
+    self.context_lengths = np.zeros(0, dtype=np.intp)
+    self.own_columns = {}
+    self.fallback_ids = {}
+
+  cdef void _add_contexts(self, contexts):
+    new_contexts = sorted(set(contexts) - self.context_index.keys(), key=_context_order)
+    for context in new_contexts:
+      self.context_index[context] = len(self.contexts)
+      self.contexts.append(context)
+    if len(new_contexts) > 0:
+      self.context_lengths = np.concatenate(
+          [self.context_lengths, np.array([len(context) for context in new_contexts], dtype=np.intp)])
+
+  cpdef np.ndarray context_columns(self, vlmc):
+    """
+      The index of every context of vlmc, in the order of its transition rows.
+    """
+    fingerprint = vlmc.fingerprint()
+    if fingerprint not in self.own_columns:
+      self._add_contexts(vlmc.contexts)
+      self.own_columns[fingerprint] = np.array([self.context_index[c] for c in vlmc.contexts], dtype=np.intp)
+      self.fallback_ids[fingerprint] = np.zeros(0, dtype=np.int32)
+    return self.own_columns[fingerprint]
+
+  cdef np.ndarray _fallback_ids(self, vlmc):
+    """
+      The id of the context of vlmc that every context of the index falls back to.
+    """
+    self.context_columns(vlmc)
+    fingerprint = vlmc.fingerprint()
+    fallback_ids = self.fallback_ids[fingerprint]
+    if len(fallback_ids) < len(self.contexts):
+      new_ids = vlmc.get_context_ids(self.contexts[len(fallback_ids):]).astype(np.int32)
+      fallback_ids = self.fallback_ids[fingerprint] = np.concatenate([fallback_ids, new_ids])
+    return fallback_ids
+
+  cpdef np.ndarray columns(self, vlmcs):
+    """
+      The sorted indices of the contexts any of vlmcs has.
+    """
+    if len(vlmcs) == 0:
+      return np.zeros(0, dtype=np.intp)
+    return np.unique(np.concatenate([self.context_columns(vlmc) for vlmc in vlmcs]))
+
+  cpdef tuple align(self, vlmcs, np.ndarray columns):
+    """
+      For every vlmc and every context of columns, the id of the context the vlmc falls
+      back to and whether it is the context itself, as two [vlmcs, columns] arrays.
+    """
+    context_ids = np.empty([len(vlmcs), len(columns)], dtype=np.intp)
+    has_context = np.empty([len(vlmcs), len(columns)], dtype=np.float64)
+    for i, vlmc in enumerate(vlmcs):
+      context_ids[i] = self._fallback_ids(vlmc)[columns]
+      # A vlmc has a context exactly when the context falls back to itself
+      has_context[i] = self.context_columns(vlmc)[context_ids[i]] == columns
+    return context_ids, has_context
+
+
+def _context_order(context):
+  return (len(context), context)
@@ -1,9 +1,10 @@
-from scipy import stats
 import numpy as np
 
-from vlmc import VLMC
 from . import NegativeLogLikelihood
 
+# Characters counted per call, the counts are accumulated over the chunks
+DEF CHUNK_SIZE = 2**16
+
 
 cdef class EstimateVLMC(object):
   """
@@ -16,6 +17,9 @@ cdef class EstimateVLMC(object):
   def __init__(self, d=NegativeLogLikelihood(1000)):
     self.d = d
 
+  def __repr__(self):
+    return "EstimateVLMC({!r})".format(self.d)
+
   cpdef double distance(self, left_vlmc, right_vlmc):
     right_distance = self._assymmetric_distance(left_vlmc, right_vlmc)
     return right_distance
@@ -27,82 +31,53 @@ cdef class EstimateVLMC(object):
     pre_sample_length = 500
     sequence_length = 100000
 
-    right_sequence = right_vlmc.generate_sequence(sequence_length, pre_sample_length)
+    right_sequence = right_vlmc.sampled_sequence(sequence_length, pre_sample_length)
 
-    left_transition_counters = self._count_events(left_vlmc, right_sequence)
-    new_left_vlmc = self._create_vlmc_by_estimating_probabilities(
-      left_vlmc.alphabet, left_transition_counters)
+    left_transition_counts = self._count_events(left_vlmc, right_sequence)
+    estimated_probabilities = self._estimate_probabilities(left_transition_counts)
 
-    # distance = self.d.distance(left_vlmc, new_left_vlmc)
-    distance = self._perform_stats_test(new_left_vlmc, left_vlmc, left_transition_counters)
+    distance = self._perform_stats_test(estimated_probabilities, left_vlmc, left_transition_counts)
     return distance
 
-  cdef object _create_vlmc_by_estimating_probabilities(self, alphabet, transition_counters):
-    cdef dict tree = {}
-    for context, counts in transition_counters.items():
-      count = sum([c for c in counts.values()])
-      if count == 0:
-        tree[context] = {'A': 0, 'C': 0, 'G': 0, 'T': 0}
-      else:
-        tree[context] = {}
-        for character in alphabet:
-          tree[context][character] = transition_counters[context][character] / count
-
-    return VLMC(tree, "estimated", {})
-
-  cdef dict _count_events(self, vlmc, sequence):
-    cdef dict transition_counters = {}
-    # Initialize counters
-    for context in vlmc.tree.keys():
-      transition_counters[context] = {}
-      for character in vlmc.alphabet:
-        transition_counters[context][character] = 0
-
-    sequence_so_far = ""
-    for character in sequence:
-      current_contexts = vlmc.get_all_contexts(sequence_so_far)
-      for context in current_contexts:
-        transition_counters[context][character] += 1
-
-      sequence_so_far = sequence_so_far + character
-
-    # return transition_counters
-    transition_counters_with_pseudo = self._add_pseudo_counts(transition_counters)
-    return transition_counters_with_pseudo
-
-  cdef dict _add_pseudo_counts(self, transition_counters):
-    for context, counts in transition_counters.items():
-      if sum([c for c in counts.values()]) != 0 and any(c == 0 for c in counts.values()):
-        transition_counters[context] = {t: c + 1 for t, c in transition_counters[context].items()}
-
-    return transition_counters
-
-  cdef double _perform_stats_test(self, estimated_vlmc, original_vlmc, transition_counters):
-    expected_values = np.array([])
-    observed_values = np.array([])
-    for context in original_vlmc.tree.keys():
-      times_visited_node = sum([c for c in transition_counters[context].values()])
-      if times_visited_node > 0:
-        transition_probabilitites = [(x, original_vlmc.tree[context][x]) for x in original_vlmc.alphabet]
-
-        # find probabilites that are greater than zero
-        probs_without_zeros = [(char_, prob) for (char_, prob) in transition_probabilitites if prob > 0]
-        # loop through all of these exept one (last)
-        for character, probability_original_vlmc in probs_without_zeros[:-1]:
-          probability_estimation = estimated_vlmc.tree[context][character]
-
-          expected_frequency = probability_original_vlmc
-          observed_frequency = probability_estimation
-          expected_values = np.append(expected_values, expected_frequency)
-          observed_values = np.append(observed_values, observed_frequency)
-
-    statistic, p_value = stats.power_divergence(f_obs=observed_values, f_exp=expected_values, lambda_="pearson")
-    # observed_mean = observed_values.mean()
-    # observed_var = observed_values.var()
-
-    # expected_mean = expected_values.mean()
-    # expected_var = expected_values.var()
-
+  cdef object _estimate_probabilities(self, transition_counts):
+    """
+      The transition probabilities estimated from the counts, zero for unvisited contexts.
+    """
+    totals = transition_counts.sum(axis=1, keepdims=True)
+    return np.divide(transition_counts, totals, out=np.zeros(transition_counts.shape), where=totals > 0)
+
+  cdef object _count_events(self, vlmc, sequence):
+    """
+      The number of times every character follows every context of vlmc in the
+      sequence, as a [contexts, alphabet] array in the order of vlmc.contexts.
+    """
+    counts = np.zeros([len(vlmc.contexts), len(vlmc.alphabet)], dtype=np.int64)
+    for start in range(0, len(sequence), CHUNK_SIZE):
+      # The previous /order/ characters are the history of the chunk
+      history_start = max(start - vlmc.order, 0)
+      vlmc.count_transitions(sequence[history_start:start + CHUNK_SIZE], counts, start - history_start)
+
+    return self._add_pseudo_counts(counts)
+
+  cdef object _add_pseudo_counts(self, transition_counts):
+    visited_with_zeros = (transition_counts.sum(axis=1) != 0) & np.any(transition_counts == 0, axis=1)
+    transition_counts[visited_with_zeros] += 1
+    return transition_counts
+
+  cdef double _perform_stats_test(self, estimated_probabilities, original_vlmc, transition_counts):
+    original_probabilities = original_vlmc.transition_matrix
+    visited = transition_counts.sum(axis=1) > 0
+    # Every probability greater than zero except the last one of each visited context
+    non_zero = original_probabilities > 0
+    last_non_zero = non_zero & (np.cumsum(non_zero[:, ::-1], axis=1)[:, ::-1] == 1)
+    included = non_zero & ~last_non_zero & visited[:, None]
+
+    expected_values = original_probabilities[included]
+    observed_values = estimated_probabilities[included]
+
+    # Pearson's chi-squared statistic, as stats.power_divergence(lambda_="pearson") without
+    # its check that the observed and expected values have the same sum, which they don't
+    statistic = np.sum((observed_values - expected_values) ** 2 / expected_values)
     # distance = np.linalg.norm(expected_values - observed_values)
     distance = statistic
     return distance
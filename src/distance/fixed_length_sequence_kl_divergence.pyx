@@ -2,36 +2,39 @@ import numpy as np
 cimport numpy as np
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
-from itertools import product, repeat
+
+from vlmc import ContextAutomaton
+from .kl_divergence_rate import state_divergences
 
 cdef class FixedLengthSequenceKLDivergence(object):
   """
   Calculates the Kullback-liebler divergence between two vlmcs given a sequence length
   D_kl (P || Q) := Σᵢ P(i)·log[ P(i)/Q(i) ]
+  By the chain rule this is the sum over the positions of the expected divergence of the
+  next character, so instead of enumerating all 4^L sequences the probability mass of
+  the left vlmc is pushed forward over the joint states of both vlmcs, one position at a time.
   """
   cdef int fixed_length
   
   def __cinit__(self, string_length):
     self.fixed_length = string_length
 
+  def __reduce__(self):
+    return (FixedLengthSequenceKLDivergence, (self.fixed_length,))
+
+  def __repr__(self):
+    return "FixedLengthSequenceKLDivergence({})".format(self.fixed_length)
+
   cpdef double distance(self, left_vlmc, right_vlmc):
-    # D_kl (P || Q) := Σᵢ P(i)·log[ P(i)/Q(i) ]
+    automaton = ContextAutomaton([left_vlmc, right_vlmc])
+    transitions_transposed = automaton.transition_matrix(left_vlmc).T.tocsr()
+    divergences = state_divergences(automaton, left_vlmc, right_vlmc)
+
+    # The probability of being in each state after the characters read so far, starting in ""
+    cdef np.ndarray state_probabilities = np.zeros(len(automaton))
+    state_probabilities[0] = 1
     cdef double KL_divergence = 0
-    cdef list alphabet = left_vlmc.alphabet
-    cdef list all_possible_sequences = [''.join(p) for p in product(alphabet, repeat=self.fixed_length)]
-    cdef double p_i = -1
-    cdef double q_i = -1
-    cdef double contribution_i = -1
-    
-    for sequence in all_possible_sequences:
-      p_i = left_vlmc.likelihood(sequence)
-      if p_i == 0:
-        contribution_i = 0
-      else:
-        if q_i == 0:
-          raise RuntimeError("When calculating Kullback")
-        q_i = right_vlmc.likelihood(sequence)
-        contribution_i = p_i * np.log(p_i/q_i)
-      KL_divergence += contribution_i
+    for position in range(self.fixed_length):
+      KL_divergence += state_probabilities @ divergences
+      state_probabilities = transitions_transposed @ state_probabilities
     return KL_divergence
-
@@ -3,51 +3,96 @@ cimport numpy as np
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
 
+from context_alignment cimport ContextAlignment
+
+DEF ALPHABET_SIZE = 4
+# The aligned transition rows of a batch are handled in chunks of contexts of at most this many values
+MAX_CHUNK_VALUES = 2**24
+
 cdef class FrobeniusNorm(object):
   """
     Distance calculated by finding the transition matricies of the vlmcs, and
     calculating the frobenius norm of the difference.
+    The transition matrices are over the contexts both vlmcs have (or, with use_union,
+    either has), a vlmc lacking a context uses the row of the context it falls back to.
+    The vlmcs are aligned to the contexts once, and the alignment is kept across calls.
   """
 
   cdef bint use_union
+  cdef ContextAlignment alignment
+  symmetric = True
 
   def __init__(self, use_union=False):
     self.use_union = use_union
+    self.alignment = ContextAlignment()
+
+  def __repr__(self):
+    return "FrobeniusNorm(use_union={})".format(self.use_union)
+
+  def __reduce__(self):
+    return (FrobeniusNorm, (self.use_union,))
 
   cpdef double distance(self, left_vlmc, right_vlmc):
-    distance = self._frobenius_norm(left_vlmc, right_vlmc)
-    return distance
-
-  cdef double _frobenius_norm(self, left_vlmc, right_vlmc):
-    cdef set shared_contexts
-    if self.use_union:
-      # union
-      shared_contexts = set(left_vlmc.tree.keys()).union(set(right_vlmc.tree.keys()))
-    else:
-      # intersection:
-      shared_contexts = set([context for context in left_vlmc.tree if context in right_vlmc.tree])
-
-
-    cdef np.ndarray[FLOATTYPE_t, ndim=2] left_matrix = self._create_matrix(left_vlmc, shared_contexts)
-    cdef np.ndarray[FLOATTYPE_t, ndim=2] right_matrix = self._create_matrix(right_vlmc, shared_contexts)
-
-    cdef np.ndarray[FLOATTYPE_t, ndim=2] frobenius_matrix = left_matrix - right_matrix
-
-    return np.linalg.norm(frobenius_matrix, ord='fro') / np.sqrt(len(shared_contexts))
-
-  cdef np.ndarray[FLOATTYPE_t, ndim=2] _create_matrix(self, vlmc, contexts_to_use):
-    cdef int rows = len(contexts_to_use)
-    cdef int columns = len(vlmc.alphabet)
-    cdef np.ndarray[FLOATTYPE_t, ndim=2] matrix = np.empty((rows, columns), dtype=FLOATTYPE)
-
-    cdef FLOATTYPE_t val
-    cdef int i, j
-    for i, context in enumerate(contexts_to_use):
-      for j, character in enumerate(vlmc.alphabet):
-        if context in vlmc.tree:
-          val = vlmc.tree[context][character]
-        else:
-          val = vlmc.tree[vlmc.get_context(context)][character]
-        matrix[i, j] = val
-
-    return matrix
+    return self.pairwise_distances([left_vlmc], [right_vlmc])[0, 0]
+
+  cpdef np.ndarray pairwise_distances(self, left_vlmcs, right_vlmcs):
+    """
+      Distances between every left and right vlmc.  All vlmcs are aligned to the union
+      of their contexts, with the rows of a context they lack taken from its fallback,
+      and the sums over the shared contexts of every pair are matrix products with the
+      context masks:
+        |S| = Ml Mrᵀ,  sum over S of |l - r|² = Nl Mrᵀ + Ml Nrᵀ - 2 (Ml∘El)(Mr∘Er)ᵀ
+      with E the aligned rows, M whether a context is in the vlmc and N the squared norms
+      of the masked rows.  The union is handled the same way, through the contexts neither
+      vlmc has.
+    """
+    squared_differences = np.zeros([len(left_vlmcs), len(right_vlmcs)], dtype=np.float64)
+    nbr_contexts = np.zeros([len(left_vlmcs), len(right_vlmcs)], dtype=np.float64)
+    if len(left_vlmcs) == 0 or len(right_vlmcs) == 0:
+      return nbr_contexts
+    columns = self.alignment.columns(list(left_vlmcs) + list(right_vlmcs))
+    left_matrix, left_offsets = _stacked_transition_matrices(left_vlmcs)
+    right_matrix, right_offsets = _stacked_transition_matrices(right_vlmcs)
+
+    chunk_size = max(1, MAX_CHUNK_VALUES // (ALPHABET_SIZE * (len(left_vlmcs) + len(right_vlmcs))))
+    for chunk_start in range(0, len(columns), chunk_size):
+      chunk = columns[chunk_start:chunk_start + chunk_size]
+      left_ids, left_has_context = self.alignment.align(left_vlmcs, chunk)
+      right_ids, right_has_context = self.alignment.align(right_vlmcs, chunk)
+      left_rows = left_matrix[left_ids + left_offsets[:, None]]
+      right_rows = right_matrix[right_ids + right_offsets[:, None]]
+      if self.use_union:
+        # The union is every context, except the ones neither vlmc has
+        left_lacks_context, right_lacks_context = 1 - left_has_context, 1 - right_has_context
+        left_norms = np.sum(left_rows ** 2, axis=2)
+        right_norms = np.sum(right_rows ** 2, axis=2)
+        squared_differences += (left_norms.sum(axis=1)[:, None] - (left_norms * left_lacks_context) @ right_lacks_context.T
+                                + right_norms.sum(axis=1)[None, :] - left_lacks_context @ (right_norms * right_lacks_context).T)
+        squared_differences -= 2 * (_flat(left_rows) @ _flat(right_rows).T
+                                    - _flat(left_rows * left_lacks_context[:, :, None])
+                                    @ _flat(right_rows * right_lacks_context[:, :, None]).T)
+        nbr_contexts += len(chunk) - left_lacks_context @ right_lacks_context.T
+      else:
+        left_rows *= left_has_context[:, :, None]
+        right_rows *= right_has_context[:, :, None]
+        left_norms = np.sum(left_rows ** 2, axis=2)
+        right_norms = np.sum(right_rows ** 2, axis=2)
+        squared_differences += left_norms @ right_has_context.T + left_has_context @ right_norms.T
+        squared_differences -= 2 * _flat(left_rows) @ _flat(right_rows).T
+        nbr_contexts += left_has_context @ right_has_context.T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return np.sqrt(np.maximum(squared_differences, 0) / nbr_contexts)
+
+
+def _stacked_transition_matrices(vlmcs):
+  """
+    The transition matrices of all vlmcs on top of each other, and the first row of each.
+  """
+  matrices = [vlmc.transition_matrix for vlmc in vlmcs]
+  offsets = np.cumsum([0] + [len(matrix) for matrix in matrices[:-1]]).astype(np.intp)
+  return np.concatenate(matrices).astype(np.float64), offsets
+
+
+def _flat(rows):
+  return rows.reshape(rows.shape[0], -1)
@@ -0,0 +1,39 @@
+import numpy as np
+cimport numpy as np
+
+from vlmc import ContextAutomaton
+
+
+cdef class KLDivergenceRate(object):
+  """
+  The Kullback-Leibler divergence rate between two vlmcs, the limit of the fixed length
+  divergence D_kl(P || Q) / L.  In the joint state space of both vlmcs, where the state
+  determines the context of either vlmc, it is
+  Σₛ π(s) Σₓ P(x|s)·log[ P(x|s)/Q(x|s) ]
+  with π the stationary distribution of the left vlmc over the joint states.
+  Transitions that are impossible in the right vlmc have the log probability of the vlmc.
+  """
+
+  def __reduce__(self):
+    return (KLDivergenceRate, ())
+
+  def __repr__(self):
+    return "KLDivergenceRate()"
+
+  cpdef double distance(self, left_vlmc, right_vlmc):
+    automaton = ContextAutomaton([left_vlmc, right_vlmc])
+    stationary_distribution = automaton.stationary_distribution(left_vlmc)
+    divergences = state_divergences(automaton, left_vlmc, right_vlmc)
+    return max(float(stationary_distribution @ divergences), 0.0)
+
+
+def state_divergences(automaton, left_vlmc, right_vlmc):
+  """
+    Σₓ P(x|s)·log[ P(x|s)/Q(x|s) ] in every state s of the automaton.
+  """
+  left_ids = automaton.context_ids(left_vlmc)
+  right_ids = automaton.context_ids(right_vlmc)
+  p = left_vlmc.transition_matrix[left_ids]
+  log_ratio = left_vlmc.log_transition_matrix[left_ids] - right_vlmc.log_transition_matrix[right_ids]
+  # Characters the left vlmc never emits do not contribute
+  return np.sum(np.where(p > 0, p * log_ratio, 0), axis=1)
@@ -1,34 +1,107 @@
-import math
+import numpy as np
+cimport numpy as np
+import scipy.sparse
+
+DEF ALPHABET_SIZE = 4
+# The closest probabilities are searched for in chunks of the right vlmcs of at most this many values
+MAX_CHUNK_VALUES = 2**22
 
 
 cdef class NaiveParameterSampling(object):
   """
     Proposed by Levinson et al. for discrete-observation density hidden Markov models.
     Appears also in the paper by Juang et al. from 1985 on "A Probablistic Distance Measure For Hidden Markov Models".
+    The distances are calculated in batches: for every context length and character, the
+    probabilities of all right vlmcs are sorted together, grouped by vlmc, so the closest
+    probability of the same order in every right vlmc is one binary search for all pairs.
   """
+  symmetric = True
+
+  def __reduce__(self):
+    return (NaiveParameterSampling, ())
 
-  def __init__(self):
-    return
+  def __repr__(self):
+    return "NaiveParameterSampling()"
 
   cpdef double distance(self, left_vlmc, right_vlmc):
-    # Assume this is the alphabet, only relevant case for us.
-    cdef list alphabet = left_vlmc.alphabet
-    cdef dict left_tree = left_vlmc.tree, right_tree = right_vlmc.tree
-
-    cdef double symmetric_distance = (self._assymmetric_distance(left_tree, right_tree, alphabet)
-                          + self._assymmetric_distance(right_tree, left_tree, alphabet)) / 2
-    return symmetric_distance
-
-  cdef double _assymmetric_distance(self, left_tree, right_tree, alphabet):
-    cdef double s
-    s = sum(self._min_value_of_same_order(right_tree, k, left_tree[k][char_], char_)
-            for k in left_tree.keys() for char_ in alphabet)
-
-    s = s / (len(alphabet) * len(left_tree.keys()))
-    s = math.sqrt(s)
-    return s
-
-  cdef double _min_value_of_same_order(self, tree, context, prob, char_):
-    cdef list probabilities = [tree[k][char_] for k in tree.keys() if len(k) == len(context)] + [0]
-    cdef double val = min(math.pow((val - prob), 2) for val in probabilities)
-    return val
+    return self.pairwise_distances([left_vlmc], [right_vlmc])[0, 0]
+
+  cpdef np.ndarray pairwise_distances(self, left_vlmcs, right_vlmcs):
+    """
+      Distances between every left and right vlmc, the average of both directions.  The
+      probabilities are grouped by context length once per call, and nothing is kept after.
+    """
+    left_probabilities = _probabilities_by_order(left_vlmcs)
+    right_probabilities = _probabilities_by_order(right_vlmcs)
+    return (_assymmetric_distances(left_vlmcs, left_probabilities, right_probabilities, len(right_vlmcs))
+            + _assymmetric_distances(right_vlmcs, right_probabilities, left_probabilities, len(left_vlmcs)).T) / 2
+
+
+def _probabilities_by_order(vlmcs):
+  """
+    For every context length, the transition rows of the contexts of that length of all
+    vlmcs, as (index of the vlmc of every row, [rows, alphabet] probabilities).
+  """
+  owners, context_lengths, rows = [], [], []
+  for i, vlmc in enumerate(vlmcs):
+    owners.append(np.full(len(vlmc.contexts), i, dtype=np.intp))
+    context_lengths.append([len(context) for context in vlmc.contexts])
+    rows.append(vlmc.transition_matrix)
+  owners = np.concatenate(owners)
+  context_lengths = np.concatenate(context_lengths)
+  rows = np.concatenate(rows)
+  return {order: (owners[context_lengths == order], rows[context_lengths == order])
+          for order in np.unique(context_lengths)}
+
+
+def _assymmetric_distances(left_vlmcs, left_probabilities, right_probabilities, nbr_right_vlmcs):
+  """
+    sqrt of the mean over the probabilities of every left vlmc of the smallest squared
+    difference to a probability of the same character and order in the right vlmc (or to 0).
+  """
+  sums = np.zeros([len(left_vlmcs), nbr_right_vlmcs], dtype=np.float64)
+  for order, (left_owners, left_rows) in left_probabilities.items():
+    # Sums the rows of each left vlmc
+    membership = scipy.sparse.csr_matrix(
+        (np.ones(len(left_owners)), (left_owners, np.arange(len(left_owners)))),
+        shape=(len(left_vlmcs), len(left_owners)))
+    right_owners, right_rows = right_probabilities.get(
+        order, (np.zeros(0, dtype=np.intp), np.zeros([0, ALPHABET_SIZE])))
+    chunk_size = max(1, MAX_CHUNK_VALUES // max(len(left_owners), 1))
+    for chunk_start in range(0, nbr_right_vlmcs, chunk_size):
+      chunk_end = min(chunk_start + chunk_size, nbr_right_vlmcs)
+      in_chunk = (right_owners >= chunk_start) & (right_owners < chunk_end)
+      for character in range(ALPHABET_SIZE):
+        min_differences = _min_squared_differences(
+            left_rows[:, character], right_owners[in_chunk] - chunk_start,
+            right_rows[in_chunk, character], chunk_end - chunk_start)
+        sums[:, chunk_start:chunk_end] += np.asarray(membership @ min_differences)
+
+  nbr_probabilities = np.array([ALPHABET_SIZE * len(vlmc.contexts) for vlmc in left_vlmcs], dtype=np.float64)
+  return np.sqrt(sums / nbr_probabilities[:, None])
+
+
+def _min_squared_differences(probabilities, owners, other_probabilities, nbr_owners):
+  """
+    The smallest squared difference of each probability to the other probabilities of
+    every owner, or to 0, as a [probabilities, owners] array.  The other probabilities are
+    sorted by (owner, probability) as the keys 2·owner + probability, the probabilities are
+    at most 1, so one binary search finds the position within the group of every owner.
+  """
+  min_differences = np.repeat((probabilities ** 2)[:, None], nbr_owners, axis=1)
+  if len(other_probabilities) == 0:
+    return min_differences
+  order = np.lexsort((other_probabilities, owners))
+  sorted_keys = 2.0 * owners[order] + other_probabilities[order]
+  sorted_probabilities = other_probabilities[order]
+  group_starts = np.searchsorted(sorted_keys, 2.0 * np.arange(nbr_owners), side='left')
+  group_ends = np.searchsorted(sorted_keys, 2.0 * np.arange(1, nbr_owners + 1), side='left')
+  non_empty = group_ends > group_starts
+
+  positions = np.searchsorted(sorted_keys, 2.0 * np.arange(nbr_owners)[None, :] + probabilities[:, None])
+  # The closest value is on either side of where the probability would be inserted
+  for neighbours in [np.maximum(positions - 1, group_starts), np.minimum(positions, group_ends - 1)]:
+    neighbours = np.clip(neighbours, 0, len(sorted_probabilities) - 1)
+    differences = np.where(non_empty, (sorted_probabilities[neighbours] - probabilities[:, None]) ** 2, np.inf)
+    min_differences = np.minimum(min_differences, differences)
+  return min_differences
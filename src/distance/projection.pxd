@@ -1,10 +1,14 @@
 cimport numpy as np
 
 cdef class Projection:
-  cdef public dict context_transition_to_array_index
+  cdef public dict context_index
   cdef public int dimension
+  cdef dict rows
   cdef list vlmcs
   cpdef set_vlmcs(self, vlmcs)
-  cdef initialize_transition_to_index_dict(self)
+  cdef void _add_contexts(self, contexts)
+  cdef tuple _sparse_row(self, vlmc)
+  cpdef object embedding(self, vlmcs)
   cpdef distance(self, left, right)
+  cpdef np.ndarray pairwise_distances(self, left_vlmcs, right_vlmcs)
   cdef np.ndarray vlmc_to_vector(self, vlmc)
@@ -1,36 +1,100 @@
 import numpy as np
 cimport numpy as np
+import scipy.sparse
 FLOATTYPE = np.float32
 ctypedef np.float32_t FLOATTYPE_t
 
+DEF ALPHABET_SIZE = 4
+
 cdef class Projection:
+  """
+    Projects every vlmc onto the vector of its transition probabilities, one column per
+    (context, character) of every context seen so far, and compares the vectors with
+    the euclidean distance.  Contexts that a vlmc lacks are zeros, so the vectors are
+    kept sparse: the context index only ever grows (columns never move), and the sparse
+    row of every vlmc is built once.
+  """
+  symmetric = True
+
+  def __cinit__(self):
+    self.context_index = {}
+    self.dimension = 0
+    self.rows = {}
+    self.vlmcs = []
+
+  def __repr__(self):
+    return "Projection()"
+
+  def __reduce__(self):
+    return (Projection, ())
+
   cpdef set_vlmcs(self, vlmcs):
     self.vlmcs = vlmcs
-    self.initialize_transition_to_index_dict()
-    self.dimension = len(self.context_transition_to_array_index) * 4
-
-  cdef initialize_transition_to_index_dict(self):
-    self.context_transition_to_array_index = {}
-    contexts_to_use = set()
-    for vlmc in self.vlmcs:
-      contexts_to_use.update(vlmc.tree.keys())
-    cdef int i = 0
-    alphabet = self.vlmcs[0].alphabet
-    for context in contexts_to_use:
-      self.context_transition_to_array_index[context] = {}
-      for character in alphabet:
-        self.context_transition_to_array_index[context][character] = i
-        i += 1
+    contexts = set()
+    for vlmc in vlmcs:
+      contexts.update(vlmc.contexts)
+    self._add_contexts(contexts)
+
+  cdef void _add_contexts(self, contexts):
+    new_contexts = sorted(set(contexts) - self.context_index.keys(), key=_context_order)
+    for context in new_contexts:
+      self.context_index[context] = len(self.context_index)
+    self.dimension = len(self.context_index) * ALPHABET_SIZE
+
+  cdef tuple _sparse_row(self, vlmc):
+    """
+      The columns and values of the non-zero transition probabilities of vlmc.
+    """
+    fingerprint = vlmc.fingerprint()
+    if fingerprint not in self.rows:
+      self._add_contexts(vlmc.contexts)
+      context_columns = np.array([self.context_index[c] for c in vlmc.contexts], dtype=np.int64)
+      columns = (context_columns[:, None] * ALPHABET_SIZE + np.arange(ALPHABET_SIZE)).ravel()
+      values = np.asarray(vlmc.transition_matrix, dtype=np.float64).ravel()
+      non_zero = values != 0
+      self.rows[fingerprint] = (columns[non_zero], values[non_zero])
+    return self.rows[fingerprint]
+
+  cpdef object embedding(self, vlmcs):
+    """
+      The vectors of vlmcs as the rows of a scipy.sparse CSR matrix.
+    """
+    rows = [self._sparse_row(vlmc) for vlmc in vlmcs]
+    row_lengths = [len(columns) for columns, _ in rows]
+    indptr = np.concatenate([[0], np.cumsum(row_lengths)]).astype(np.int64)
+    if len(rows) > 0:
+      indices = np.concatenate([columns for columns, _ in rows])
+      data = np.concatenate([values for _, values in rows])
+    else:
+      indices, data = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    matrix = scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(rows), self.dimension))
+    matrix.sort_indices()
+    return matrix
 
   cpdef distance(self, left, right):
-    left_vector = self.vlmc_to_vector(left)
-    right_vector = self.vlmc_to_vector(right)
-    return np.linalg.norm(left_vector - right_vector)
+    return self.pairwise_distances([left], [right])[0, 0]
+
+  cpdef np.ndarray pairwise_distances(self, left_vlmcs, right_vlmcs):
+    """
+      Distances between every left and right vlmc, from the sparse Gram matrix
+      |x - y|² = |x|² + |y|² - 2 x·y, so the cost follows the non-zeros, not the dimension.
+    """
+    left_vectors = self.embedding(left_vlmcs)
+    right_vectors = self.embedding(right_vlmcs)
+    # The dimension may have grown while embedding the right vlmcs
+    left_vectors.resize(left_vectors.shape[0], self.dimension)
+    gram = (left_vectors @ right_vectors.T).toarray()
+    left_norms = np.asarray(left_vectors.multiply(left_vectors).sum(axis=1)).ravel()
+    right_norms = np.asarray(right_vectors.multiply(right_vectors).sum(axis=1)).ravel()
+    squared_distances = left_norms[:, None] + right_norms[None, :] - 2 * gram
+    return np.sqrt(np.maximum(squared_distances, 0))
 
   cdef np.ndarray vlmc_to_vector(self, vlmc):
+    columns, values = self._sparse_row(vlmc)
     cdef np.ndarray[FLOATTYPE_t, ndim = 1] array = np.zeros(self.dimension, dtype=FLOATTYPE)
-    for context in vlmc.tree:
-      for character in vlmc.alphabet:
-        index = self.context_transition_to_array_index[context][character]
-        array[index] = vlmc.tree[context][character]
+    array[columns] = values
     return array
+
+
+def _context_order(context):
+  return (len(context), context)
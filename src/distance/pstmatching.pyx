@@ -1,51 +1,101 @@
+import numpy as np
+cimport numpy as np
+
+from context_alignment cimport ContextAlignment
+
+DEF ALPHABET_SIZE = 4
+# The pairs of a batch are handled in tiles of at most this many values
+MAX_CHUNK_VALUES = 2**24
+
 cdef class PSTMatching(object):
+  """
+    Matches the contexts of two vlmcs.  Every context either vlmc has costs its weight,
+    the mean occurrence probability of the context (or the one it falls back to) in the
+    vlmcs, times the difference of the transition probabilities if both have the context,
+    or else the difference in length to the context the other vlmc falls back to.
+    The vlmcs are aligned to the contexts once, and the alignment is kept across calls.
+  """
 
   cdef public double dissimilarity_weight
+  cdef ContextAlignment alignment
+  symmetric = True
 
   def __cinit__(self, dissimilarity_weight):
     self.dissimilarity_weight = dissimilarity_weight
+    self.alignment = ContextAlignment()
+
+  def __reduce__(self):
+    return (PSTMatching, (self.dissimilarity_weight,))
+
+  def __repr__(self):
+    return "PSTMatching({})".format(self.dissimilarity_weight)
 
   cpdef double distance(self, left_vlmc, right_vlmc):
-    cdef set union = set(left_vlmc.tree.keys()).union(set(right_vlmc.tree.keys()))
-    cdef set intersection = set(left_vlmc.tree.keys()).intersection(set(right_vlmc.tree.keys()))
-    distance = 0
-    
-    for state in union:
-      probability_term = (1 - self.dissimilarity_weight) * self.probability_cost(state, left_vlmc, right_vlmc)
-      dissimilarity_term = self.dissimilarity_weight * self.dissimilarity_cost(state, left_vlmc, right_vlmc)
-      weight = self.state_weight(state, left_vlmc, right_vlmc)
-      distance += weight * (probability_term + dissimilarity_term)
-    return distance / len(intersection)
-
-
-  cdef double state_weight(self, state, left_vlmc, right_vlmc):
-    left_state = left_vlmc.get_context(state)
-    right_state = right_vlmc.get_context(state)
-    weight = (left_vlmc.occurrence_probability(left_state) + right_vlmc.occurrence_probability(right_state)) / 2
-    return weight
-
-
-  cdef double dissimilarity_cost(self, state, left_vlmc, right_vlmc):
-    if state in left_vlmc.tree and state in right_vlmc.tree:
-      return 0.0
-    if state in left_vlmc.tree:
-      return self._dissimilarity_cost(left_vlmc, right_vlmc, state)
-    else:
-      return self._dissimilarity_cost(right_vlmc, left_vlmc, state)
-
-
-  cdef double _dissimilarity_cost(self, vlmc, vlmc_without_state, state):
-    closest_state_in_other = vlmc_without_state.get_context(state)
-    distance_difference = abs(len(closest_state_in_other) - len(state))
-    max_len = max(len(closest_state_in_other), len(state))
-    return distance_difference / max_len
-        
-
-  cdef double probability_cost(self, state, left_vlmc, right_vlmc):
-    if state in left_vlmc.tree and state in right_vlmc.tree:
-      probability_vector_difference = sum([abs(left_vlmc.tree[state][character] - right_vlmc.tree[state][character])
-                                          for character in left_vlmc.alphabet])
-      probability_cost = probability_vector_difference / 2
-      return probability_cost
-    else:
-      return 0
+    return self.pairwise_distances([left_vlmc], [right_vlmc])[0, 0]
+
+  cpdef np.ndarray pairwise_distances(self, left_vlmcs, right_vlmcs):
+    """
+      Distances between every left and right vlmc, over tiles of pairs small enough for
+      the values of all pairs of a tile over all contexts of the batch.
+    """
+    left_vlmcs, right_vlmcs = list(left_vlmcs), list(right_vlmcs)
+    costs = np.zeros([len(left_vlmcs), len(right_vlmcs)], dtype=np.float64)
+    nbr_shared_contexts = np.zeros([len(left_vlmcs), len(right_vlmcs)], dtype=np.float64)
+
+    nbr_contexts = len(self.alignment.columns(left_vlmcs + right_vlmcs))
+    nbr_tile_pairs = max(1, MAX_CHUNK_VALUES // (ALPHABET_SIZE * max(nbr_contexts, 1)))
+    left_tile_size = max(1, min(len(left_vlmcs), int(np.sqrt(nbr_tile_pairs))))
+    right_tile_size = max(1, nbr_tile_pairs // left_tile_size)
+    for left_start in range(0, len(left_vlmcs), left_tile_size):
+      left_end = min(left_start + left_tile_size, len(left_vlmcs))
+      for right_start in range(0, len(right_vlmcs), right_tile_size):
+        right_end = min(right_start + right_tile_size, len(right_vlmcs))
+        tile = np.s_[left_start:left_end, right_start:right_end]
+        costs[tile], nbr_shared_contexts[tile] = self._tile_costs(left_vlmcs[left_start:left_end],
+                                                                  right_vlmcs[right_start:right_end])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return costs / nbr_shared_contexts
+
+  cdef tuple _tile_costs(self, left_vlmcs, right_vlmcs):
+    """
+      The summed costs and the number of shared contexts of every pair of a tile.  The
+      vlmcs are aligned to the contexts any of them has, and the costs of all pairs are
+      array operations over those contexts.
+    """
+    columns = self.alignment.columns(left_vlmcs + right_vlmcs)
+    context_lengths = self.alignment.context_lengths[columns].astype(np.float64)
+    left_rows, left_occurrences, left_lengths, left_has_context = self._aligned_contexts(left_vlmcs, columns)
+    right_rows, right_occurrences, right_lengths, right_has_context = self._aligned_contexts(right_vlmcs, columns)
+
+    # [left, right, context]
+    left_has = left_has_context[:, None, :]
+    right_has = right_has_context[None, :, :]
+    weights = (left_occurrences[:, None, :] + right_occurrences[None, :, :]) / 2
+
+    probability_costs = left_has * right_has * np.sum(
+        np.abs(left_rows[:, None, :, :] - right_rows[None, :, :, :]), axis=3) / 2
+    # A context only one vlmc has costs the relative length it loses in the other one
+    with np.errstate(divide='ignore', invalid='ignore'):
+      dissimilarity_costs = (left_has * (1 - right_has) * (context_lengths - right_lengths[None, :, :])
+                             + (1 - left_has) * right_has * (context_lengths - left_lengths[:, None, :]))
+      dissimilarity_costs = np.where(context_lengths > 0, dissimilarity_costs / context_lengths, 0)
+
+    costs = np.sum(weights * ((1 - self.dissimilarity_weight) * probability_costs
+                              + self.dissimilarity_weight * dissimilarity_costs), axis=2)
+    return costs, left_has_context @ right_has_context.T
+
+  cdef tuple _aligned_contexts(self, vlmcs, columns):
+    """
+      The transition rows, occurrence probabilities and lengths of the context every vlmc
+      falls back to for every context of columns, and whether it has the context itself.
+    """
+    context_ids, has_context = self.alignment.align(vlmcs, columns)
+    # The values of all vlmcs on top of each other, with the first row of each
+    offsets = np.cumsum([0] + [len(vlmc.contexts) for vlmc in vlmcs[:-1]]).astype(np.intp)
+    context_ids += offsets[:, None]
+    rows = np.concatenate([vlmc.transition_matrix for vlmc in vlmcs]).astype(np.float64)[context_ids]
+    occurrences = np.concatenate([vlmc.context_occurrence_probabilities() for vlmc in vlmcs])[context_ids]
+    lengths = self.alignment.context_lengths[
+        np.concatenate([self.alignment.context_columns(vlmc) for vlmc in vlmcs])][context_ids]
+    return rows, occurrences, lengths.astype(np.float64), has_context
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from distance import FrobeniusNorm, frobenius
+
+
+def reference_distance(left, right, use_union):
+  """
+    The original implementation, the transition matrices built context by context.
+  """
+  if use_union:
+    contexts = set(left.tree) | set(right.tree)
+  else:
+    contexts = set(left.tree) & set(right.tree)
+
+  def matrix(vlmc):
+    return np.array([[vlmc.tree[vlmc.get_context(context)][char_] for char_ in 'ACGT'] for context in contexts])
+  return np.linalg.norm(matrix(left) - matrix(right), ord='fro') / np.sqrt(len(contexts))
+
+
+@pytest.mark.parametrize('use_union', [False, True])
+@pytest.mark.parametrize('max_chunk_values', [2**24, 50])
+def test_pairwise_distances_match_the_reference(vlmcs, monkeypatch, use_union, max_chunk_values):
+  monkeypatch.setattr(frobenius, 'MAX_CHUNK_VALUES', max_chunk_values)
+  d = FrobeniusNorm(use_union)
+  # The squared norms are expanded, so a distance of 0 is off by the square root of the rounding
+  tolerances = dict(rtol=1e-7, atol=1e-6)
+  expected = np.array([[reference_distance(left, right, use_union) for right in vlmcs] for left in vlmcs])
+  # The first calls align a few vlmcs, the later ones extend the alignment with new contexts
+  assert np.allclose(d.pairwise_distances(vlmcs[:2], vlmcs[1:3]), expected[:2, 1:3], **tolerances)
+  assert np.allclose(d.pairwise_distances(vlmcs[3:], vlmcs[:4]), expected[3:, :4], **tolerances)
+  assert np.allclose(d.pairwise_distances(vlmcs, vlmcs), expected, **tolerances)
+  assert np.isclose(d.distance(vlmcs[5], vlmcs[0]), expected[5, 0], **tolerances)
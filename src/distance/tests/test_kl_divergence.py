@@ -0,0 +1,33 @@
+from itertools import product
+
+import numpy as np
+
+from distance import FixedLengthSequenceKLDivergence, KLDivergenceRate
+
+
+def brute_force_kl_divergence(left, right, sequence_length):
+  """
+    Σᵢ P(i)·log[ P(i)/Q(i) ] over all 4^L sequences i.
+  """
+  divergence = 0.0
+  for characters in product('ACGT', repeat=sequence_length):
+    sequence = ''.join(characters)
+    left_log_likelihood = left.log_likelihood(sequence)
+    if left.likelihood(sequence) > 0:
+      divergence += np.exp(left_log_likelihood) * (left_log_likelihood - right.log_likelihood(sequence))
+  return divergence
+
+
+def test_fixed_length_kl_divergence_is_the_sum_over_all_sequences(vlmcs):
+  d = FixedLengthSequenceKLDivergence(5)
+  for left in vlmcs[:3]:
+    for right in vlmcs[:3]:
+      assert np.isclose(d.distance(left, right), brute_force_kl_divergence(left, right, 5))
+
+
+def test_kl_divergence_rate_is_the_limit_of_the_increments(vlmcs):
+  for left in vlmcs[:3]:
+    for right in vlmcs[:3]:
+      increment = (FixedLengthSequenceKLDivergence(201).distance(left, right)
+                   - FixedLengthSequenceKLDivergence(200).distance(left, right))
+      assert np.isclose(KLDivergenceRate().distance(left, right), increment, rtol=1e-4, atol=1e-6)
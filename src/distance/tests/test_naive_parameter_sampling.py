@@ -0,0 +1,28 @@
+import math
+
+import numpy as np
+import pytest
+
+from distance import NaiveParameterSampling, naive_parameter_sampling
+
+
+def reference_distance(left, right):
+  """
+    The original implementation, a linear scan for the closest probability of every context.
+  """
+  def assymmetric_distance(left_tree, right_tree):
+    s = sum(min((value - left_tree[k].get(char_, 0.0)) ** 2
+                for value in [right_tree[c].get(char_, 0.0) for c in right_tree if len(c) == len(k)] + [0])
+            for k in left_tree for char_ in 'ACGT')
+    return math.sqrt(s / (4 * len(left_tree)))
+  return (assymmetric_distance(left.tree, right.tree) + assymmetric_distance(right.tree, left.tree)) / 2
+
+
+@pytest.mark.parametrize('max_chunk_values', [2**22, 50])
+def test_pairwise_distances_match_the_reference(vlmcs, monkeypatch, max_chunk_values):
+  monkeypatch.setattr(naive_parameter_sampling, 'MAX_CHUNK_VALUES', max_chunk_values)
+  d = NaiveParameterSampling()
+  distances = d.pairwise_distances(vlmcs[:4], vlmcs)
+  expected = np.array([[reference_distance(left, right) for right in vlmcs] for left in vlmcs[:4]])
+  assert np.allclose(distances, expected, rtol=1e-12, atol=1e-12)
+  assert np.isclose(d.distance(vlmcs[1], vlmcs[5]), expected[1, 5])
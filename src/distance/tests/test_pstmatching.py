@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from distance import PSTMatching, pstmatching
+from vlmc import VLMC
+
+
+def reference_distance(left, right, dissimilarity_weight):
+  """
+    The original implementation, context by context over the union of the contexts.
+  """
+  def dissimilarity_cost(vlmc_without_state, state):
+    closest_state_in_other = vlmc_without_state.get_context(state)
+    return abs(len(closest_state_in_other) - len(state)) / max(len(closest_state_in_other), len(state))
+
+  distance = 0
+  for state in set(left.tree) | set(right.tree):
+    weight = (left.occurrence_probability(left.get_context(state))
+              + right.occurrence_probability(right.get_context(state))) / 2
+    if state in left.tree and state in right.tree:
+      probability_cost = sum(abs(left.tree[state][c] - right.tree[state][c]) for c in 'ACGT') / 2
+      dissimilarity = 0.0
+    else:
+      probability_cost = 0.0
+      dissimilarity = dissimilarity_cost(right, state) if state in left.tree else dissimilarity_cost(left, state)
+    distance += weight * ((1 - dissimilarity_weight) * probability_cost + dissimilarity_weight * dissimilarity)
+  return distance / len(set(left.tree) & set(right.tree))
+
+
+@pytest.fixture
+def vlmcs_with_occurrences(vlmcs):
+  rng = np.random.default_rng(6)
+  return [VLMC(vlmc.tree, vlmc.name, {context: float(rng.random()) for context in vlmc.tree}) for vlmc in vlmcs]
+
+
+@pytest.mark.parametrize('max_chunk_values', [2**24, 500])
+def test_pairwise_distances_match_the_reference(vlmcs_with_occurrences, monkeypatch, max_chunk_values):
+  monkeypatch.setattr(pstmatching, 'MAX_CHUNK_VALUES', max_chunk_values)
+  vlmcs = vlmcs_with_occurrences
+  d = PSTMatching(0.3)
+  expected = np.array([[reference_distance(left, right, 0.3) for right in vlmcs] for left in vlmcs])
+  # The first calls align a few vlmcs, the later ones extend the alignment with new contexts
+  assert np.allclose(d.pairwise_distances(vlmcs[:2], vlmcs[1:3]), expected[:2, 1:3], rtol=1e-12, atol=1e-12)
+  assert np.allclose(d.pairwise_distances(vlmcs[3:], vlmcs[:4]), expected[3:, :4], rtol=1e-12, atol=1e-12)
+  assert np.allclose(d.pairwise_distances(vlmcs, vlmcs), expected, rtol=1e-12, atol=1e-12)
+  assert np.isclose(d.distance(vlmcs[5], vlmcs[0]), expected[5, 0], rtol=1e-12, atol=1e-12)
@@ -27,10 +27,10 @@ def print_relations(vlmcs, metadata):
 
 
 def print_stationary_differences(metadata, same_taxonomy, vlmc):
-  vlmc_distribution = vlmc.estimated_context_distribution(100000)
+  vlmc_distribution = vlmc.context_distribution()
   for other in same_taxonomy:
     print(metadata[other.name]['species'], other.name)
-    other_distribution = other.estimated_context_distribution(100000)
+    other_distribution = other.context_distribution()
     for i, ctx in enumerate(other_distribution.keys()):
       if ctx in vlmc_distribution:
         s = abs(other_distribution[ctx] - vlmc_distribution[ctx])
@@ -21,24 +21,23 @@ from util.draw_clusters import draw_graph, plot_largest_components
 from util.print_clusters import print_connected_components, print_cluster_metrics
 
 
-def test_clustering(d, clusters, vlmcs, out_directory, cluster_class=MSTClustering, do_draw_graph=True):
+def test_clustering(d, clusters, vlmcs, out_directory, cluster_class=MSTClustering, do_draw_graph=True,
+                    processes=1, distance_directory=None):
   metadata = get_metadata_for([vlmc.name for vlmc in vlmcs])
 
-  clustering = cluster_class(vlmcs, d, metadata)
-  for i in range(clusters + 0, clusters - 1, -1):
-    print(i)
-    clustering_metrics = clustering.cluster(i)
+  clustering = cluster_class(vlmcs, d, metadata, processes, distance_directory)
+  clustering_metrics = clustering.cluster(clusters)
 
-    if do_draw_graph:
-      plot_largest_components(clustering_metrics, i, out_directory)
+  if do_draw_graph:
+    plot_largest_components(clustering_metrics, clusters, out_directory)
 
-      pictures = [('Family', 'family'), ('Genus', 'genus'),
-                  ('Host', 'hosts'), ('Baltimore', 'baltimore')]
-      for name, key in pictures:
-        draw_graph(clustering_metrics, name, key, i, out_directory)
+    pictures = [('Family', 'family'), ('Genus', 'genus'),
+                ('Host', 'hosts'), ('Baltimore', 'baltimore')]
+    for name, key in pictures:
+      draw_graph(clustering_metrics, name, key, clusters, out_directory)
 
-    print_connected_components(clustering_metrics)
-    print_cluster_metrics(clustering_metrics, i)
+  print_connected_components(clustering_metrics)
+  print_cluster_metrics(clustering_metrics, clusters)
 
 
 def parse_trees(args):
@@ -81,7 +80,8 @@ def test(args):
   except:
     os.mkdir(args.out_directory)
 
-  test_clustering(d, args.clusters, vlmcs, args.out_directory, cluster_class, args.draw_graph)
+  test_clustering(d, args.clusters, vlmcs, args.out_directory, cluster_class, args.draw_graph,
+                  args.processes, args.distance_directory)
 
 
 def add_clustering_arguments(parser):
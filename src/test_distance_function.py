@@ -16,7 +16,9 @@ if __name__ == '__main__':
 
 from vlmc import VLMC
 from distance import NegativeLogLikelihood, NaiveParameterSampling, StationaryDistribution,\
-    ACGTContent, FrobeniusNorm, EstimateVLMC, FixedLengthSequenceKLDivergence, Projection, PSTMatching
+    ACGTContent, FrobeniusNorm, EstimateVLMC, FixedLengthSequenceKLDivergence, Projection, PSTMatching,\
+    KLDivergenceRate
+from clustering import calculate_distances_within_vlmcs
 import parse_trees_to_json
 from get_signature_metadata import get_metadata_for
 from util.print_distance import print_metrics, print_distance_output
@@ -25,7 +27,8 @@ from util.draw_distance import plot_distance, update_gc_box_data, update_metadat
     plot_cummlative_box, plot_gc_box
 
 
-def test_distance_function(d, tree_dir, out_dir, plot_distances=False, plot_boxes=False):
+def test_distance_function(d, tree_dir, out_dir, plot_distances=False, plot_boxes=False,
+                           processes=1, distance_directory=None):
   parse_trees_to_json.parse_trees(tree_dir)
   vlmcs = VLMC.from_json_dir(tree_dir)
 
@@ -44,12 +47,14 @@ def test_distance_function(d, tree_dir, out_dir, plot_distances=False, plot_boxe
       os.mkdir(out_dir)
 
   return test_distance_function_(d, vlmcs, test_vlmcs, metadata, out_dir,
-                                 True, False, plot_distances, plot_boxes)
+                                 True, False, plot_distances, plot_boxes,
+                                 processes, distance_directory)
 
 
 def test_distance_function_(d, vlmcs, test_vlmcs, metadata, out_dir,
                             do_print_metrics=True, print_every_distance=False,
-                            plot_distances=False, plot_boxes=False):
+                            plot_distances=False, plot_boxes=False,
+                            processes=1, distance_directory=None):
   metrics = {
       "distance_name": d.__class__.__name__,
       "average_procent_of_genus_in_top": 0.0,
@@ -69,8 +74,18 @@ def test_distance_function_(d, vlmcs, test_vlmcs, metadata, out_dir,
   all_family_orders = np.empty((len(vlmcs), len(vlmcs)))
   all_genus_orders = np.empty((len(vlmcs), len(vlmcs)))
 
+  # With a symmetric distance, every row is read from the (stored) distances between all vlmcs
+  all_distances = None
+  if getattr(d, 'symmetric', False):
+    start_time = time.time()
+    all_distances = calculate_distances_within_vlmcs(vlmcs, d, processes, distance_directory).square()
+    elapsed_time = (time.time() - start_time) / len(vlmcs)
+
   for index, vlmc in enumerate(vlmcs):
-    sorted_results, elapsed_time = calculate_distances(d, vlmc, vlmcs)
+    if all_distances is None:
+      sorted_results, elapsed_time = calculate_distances(d, vlmc, vlmcs)
+    else:
+      sorted_results = sorted(zip(all_distances[index], vlmcs), key=lambda t: t[0])
 
     metrics = update_metrics(vlmc, vlmcs, sorted_results, metadata, elapsed_time, metrics)
     update_gc_box_data(vlmc, index, sorted_results, all_gc_differences, gc_distance_function)
@@ -135,6 +150,9 @@ def parse_distance_method(args):
   elif args.fixed_length_kl_divergence:
     print("Testing distance with fixed length kl, with {} length".format(args.fixed_sequence_length))
     return FixedLengthSequenceKLDivergence(args.fixed_sequence_length)
+  elif args.kl_divergence_rate:
+    print("Testing distance with the kl divergence rate")
+    return KLDivergenceRate()
   else:
     return FrobeniusNorm(args.use_union)
 
@@ -147,7 +165,8 @@ def test(args):
     os.mkdir(args.out_directory)
 
   test_distance_function(d, args.directory, args.out_directory,
-                         args.plot_distances, args.plot_boxes)
+                         args.plot_distances, args.plot_boxes,
+                         args.processes, args.distance_directory)
 
 
 def add_distance_arguments(parser):
@@ -158,6 +177,7 @@ def add_distance_arguments(parser):
   parser.add_argument('--frobenius-norm', action='store_true')
   parser.add_argument('--estimate-vlmc', action='store_true')
   parser.add_argument('--fixed-length-kl-divergence', action='store_true')
+  parser.add_argument('--kl-divergence-rate', action='store_true')
   parser.add_argument('--pst-matching', action='store_true')
 
   parser.add_argument('--fixed-sequence-length', type=int, default=8,
@@ -166,6 +186,10 @@ def add_distance_arguments(parser):
                       help='The length of the sequences that are generated to calculate the likelihood.')
   parser.add_argument('--dissimilarity-weight', type=float, default=0.5)
   parser.add_argument('--use-union', action='store_true')
+  parser.add_argument('--processes', type=int, default=1,
+                      help='The number of processes used to calculate the distances between all vlmcs.')
+  parser.add_argument('--distance-directory', type=str, default='../distances',
+                      help='The directory where the distances between all vlmcs are stored and reused.')
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(
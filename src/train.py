@@ -1,6 +1,8 @@
 import os
 import subprocess
 
+from vlmc import decode_sequence
+
 
 def train(vlmcs, sequence_length, out_directory, number_of_parameters=128):
   os.system("rm -rf {}/*".format(out_directory))
@@ -33,14 +35,8 @@ def write_sequence_as_fasta(vlmc, sequence_length, out_directory):
   with open(os.path.join(out_directory, file_name), 'w') as f:
     f.write("> {}\n".format(vlmc.name))
     # Iteratively generate lines from a sequence of correct length
-    for _ in range(sequence_length // size_of_line):
-      sequence = vlmc.generate_sequence_from(size_of_line, context)
-      f.write("{}\n".format(sequence))
-      context = sequence[-vlmc.order]
-
-    length_left = sequence_length % size_of_line
-    sequence = vlmc.generate_sequence_from(length_left, context)
-    f.write("{}\n".format(sequence))
+    for line in vlmc.generate_sequence_chunks(sequence_length, size_of_line, context):
+      f.write("{}\n".format(decode_sequence(line)))
 
 
 def train_vlmcs(parameters, list_path, out_directory, input_directory=None, add_underlines_=True):
@@ -99,13 +99,13 @@ def _draw_legend(G, metadata, meta_name, meta, meta_colors, meta_colormap):
 
 
 def _plot_silhouette(clustering_metrics, cluster_colors, meta_key, out_directory):
-  G = clustering_metrics.G
   metadata = clustering_metrics.metadata
   silhouette = clustering_metrics.silhouette_metric()
   bar_heights = []
   bar_labels = []
   bar_colors = []
-  connected_components = list(nx.connected_components(G))
+  # In the same order as the connected components of G, which the colors are for
+  connected_components = clustering_metrics.clusters()
 
   for i, cluster in enumerate(connected_components):
     for species in cluster:
@@ -124,7 +124,7 @@ def _plot_silhouette(clustering_metrics, cluster_colors, meta_key, out_directory
 
 
 def plot_largest_components(clustering_metrics, clusters, out_dir):
-  connected_components = list(nx.connected_components(clustering_metrics.G))
+  connected_components = clustering_metrics.clusters()
 
   sorted_components = sorted(connected_components, key=lambda c: len(c))
   largest = sorted_components[-6:]
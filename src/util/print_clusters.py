@@ -1,14 +1,11 @@
-import networkx as nx
-
-
 def print_connected_components(clustering_metrics):
-  G = clustering_metrics.G
+  clusters = clustering_metrics.clusters()
   connected_component_metrics = [component_metrics(
-      connected, clustering_metrics) for connected in nx.connected_components(G)]
+      connected, clustering_metrics) for connected in clusters]
 
   metadata = clustering_metrics.metadata
   output = ["cluster {}:\n".format(i) + component_string(connected, metadata, connected_component_metrics[i])
-            for i, connected in enumerate(nx.connected_components(G))]
+            for i, connected in enumerate(clusters)]
 
   print('\n\n'.join(output))
 
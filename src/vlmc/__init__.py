@@ -1 +1,3 @@
-from .vlmc import VLMC
+from .vlmc import VLMC, encode_sequence, decode_sequence, log_likelihoods
+from .sequence_cache import SequenceCache, sequence_cache
+from .context_automaton import ContextAutomaton
@@ -0,0 +1,114 @@
+import numpy as np
+cimport numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+INTTYPE = np.intp
+
+DEF ALPHABET_SIZE = 4
+DEF MAX_POWER_ITERATIONS = 100000
+DEF TOLERANCE = 1e-12
+
+
+cdef class ContextAutomaton(object):
+  """
+    The joint state space of one or more vlmcs.  The states are every substring of
+    every context, so the set is closed under prefixes and suffixes.  The state of a
+    history is its longest suffix among the states; it determines the context of the
+    history in every vlmc (the longest suffix of the state that is a context), and after
+    a character x the next state is the longest suffix of state·x among the states.
+    The states are sorted by length, so the empty history "" is state 0.
+  """
+  cdef public list states
+  cdef public dict state_index
+  cdef public np.ndarray next_state
+
+  def __cinit__(self, vlmcs):
+    substrings = set([""])
+    for vlmc in vlmcs:
+      for context in vlmc.contexts:
+        for start in range(len(context)):
+          for end in range(start + 1, len(context) + 1):
+            substrings.add(context[start:end])
+    self.states = sorted(substrings, key=_state_order)
+    self.state_index = {state: i for i, state in enumerate(self.states)}
+
+    alphabet = vlmcs[0].alphabet
+    self.next_state = np.zeros([len(self.states), ALPHABET_SIZE], dtype=INTTYPE)
+    cdef Py_ssize_t i, character
+    for i, state in enumerate(self.states):
+      for character, char_ in enumerate(alphabet):
+        if state + char_ in self.state_index:
+          self.next_state[i, character] = self.state_index[state + char_]
+        elif len(state) > 0:
+          # The suffixes of state·x are the suffixes of state[1:]·x, which are done already
+          self.next_state[i, character] = self.next_state[self.state_index[state[1:]], character]
+        else:
+          self.next_state[i, character] = 0
+
+  def __len__(self):
+    return len(self.states)
+
+  cpdef np.ndarray context_ids(self, vlmc):
+    """
+      The id of the context of vlmc in every state.
+    """
+    return vlmc.get_context_ids(self.states)
+
+  cpdef object transition_matrix(self, vlmc):
+    """
+      The transition probabilities of vlmc between the states, as a sparse CSR matrix.
+    """
+    probabilities = vlmc.transition_matrix[self.context_ids(vlmc)]
+    rows = np.repeat(np.arange(len(self.states)), ALPHABET_SIZE)
+    matrix = scipy.sparse.csr_matrix((probabilities.ravel(), (rows, self.next_state.ravel())),
+                                     shape=(len(self.states), len(self.states)))
+    matrix.eliminate_zeros()
+    return matrix
+
+  cpdef np.ndarray stationary_distribution(self, vlmc):
+    """
+      The stationary distribution of vlmc over the states, solved as the sparse linear
+      system π(I - A) = 0, Σπ = 1.  If that has no unique solution (more than one closed
+      class of states), the distribution is the long run average of the chain started in "".
+    """
+    transitions = self.transition_matrix(vlmc)
+    nbr_states = len(self.states)
+    system = (scipy.sparse.identity(nbr_states, format='csr') - transitions).T.tolil()
+    system[nbr_states - 1, :] = np.ones(nbr_states)
+    right_hand_side = np.zeros(nbr_states)
+    right_hand_side[nbr_states - 1] = 1
+
+    with np.errstate(all='ignore'):
+      try:
+        distribution = scipy.sparse.linalg.spsolve(system.tocsc(), right_hand_side)
+      except RuntimeError:
+        distribution = np.full(nbr_states, np.nan)
+    residual = transitions.T @ distribution - distribution
+    if (np.all(np.isfinite(distribution)) and np.all(distribution > -1e-9)
+        and np.max(np.abs(residual)) < 1e-8):
+      distribution = np.maximum(distribution, 0)
+      return distribution / np.sum(distribution)
+
+    return _long_run_average(transitions)
+
+
+def _long_run_average(transitions):
+  """
+    The Cesàro average of the chain started in state 0, which also exists for periodic chains.
+  """
+  transitions_transposed = transitions.T.tocsr()
+  distribution = np.zeros(transitions.shape[0])
+  distribution[0] = 1
+  average = distribution.copy()
+  for iteration in range(1, MAX_POWER_ITERATIONS):
+    distribution = transitions_transposed @ distribution
+    new_average = average + (distribution - average) / (iteration + 1)
+    if np.max(np.abs(new_average - average)) < TOLERANCE:
+      return new_average
+    average = new_average
+  return average
+
+
+def _state_order(state):
+  return (len(state), state)
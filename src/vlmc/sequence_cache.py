@@ -0,0 +1,97 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SequenceCache(object):
+  """
+    Least recently used cache of generated (encoded) sequences, keyed by
+    (model fingerprint, length, burn-in, seed) so that every distance function
+    reuses the same sampled sequences.  If a directory is given, the sequences are
+    also written there as packed 2-bit arrays, to be shared between processes and runs.
+  """
+
+  def __init__(self, max_bytes=2**28, directory=None):
+    self.max_bytes = max_bytes
+    self.directory = directory
+    self.sequences = OrderedDict()
+    self.size_in_bytes = 0
+
+  def get(self, vlmc, sequence_length, pre_sample_length, seed):
+    key = (vlmc.fingerprint(), sequence_length, pre_sample_length, seed)
+    if key in self.sequences:
+      self.sequences.move_to_end(key)
+      return self.sequences[key]
+
+    sequence = self._load(key)
+    if sequence is None:
+      rng = np.random.default_rng(seed)
+      sequence = vlmc.generate_encoded_sequence(sequence_length + pre_sample_length, "", rng)
+      sequence = sequence[pre_sample_length:]
+      self._save(key, sequence)
+
+    self._insert(key, sequence)
+    return sequence
+
+  def clear(self, vlmc=None):
+    """
+      Removes the sequences of vlmc, or every sequence, from memory.
+    """
+    if vlmc is None:
+      self.sequences.clear()
+      self.size_in_bytes = 0
+      return
+
+    fingerprint = vlmc.fingerprint()
+    for key in [k for k in self.sequences if k[0] == fingerprint]:
+      self.size_in_bytes -= self.sequences.pop(key).nbytes
+
+  def _insert(self, key, sequence):
+    # Sequences are shared, make sure no one changes them.
+    sequence.flags.writeable = False
+    self.sequences[key] = sequence
+    self.size_in_bytes += sequence.nbytes
+
+    while self.size_in_bytes > self.max_bytes and len(self.sequences) > 1:
+      _, evicted = self.sequences.popitem(last=False)
+      self.size_in_bytes -= evicted.nbytes
+
+  def _path(self, key):
+    return os.path.join(self.directory, "{}_{}_{}_{}.npy".format(*key))
+
+  def _load(self, key):
+    if self.directory is None or not os.path.isfile(self._path(key)):
+      return None
+    packed_sequence = np.load(self._path(key))
+    return unpack_sequence(packed_sequence, key[1])
+
+  def _save(self, key, sequence):
+    if self.directory is None:
+      return
+    os.makedirs(self.directory, exist_ok=True)
+    # Write to a temporary file first, so other processes never read half a sequence
+    temporary_path = "{}.{}.tmp".format(self._path(key), os.getpid())
+    with open(temporary_path, 'wb') as f:
+      np.save(f, pack_sequence(sequence))
+    os.replace(temporary_path, self._path(key))
+
+
+def pack_sequence(sequence):
+  """
+    Packs an encoded sequence into 2 bits per character, four characters per byte.
+  """
+  padded_sequence = np.zeros(-(-len(sequence) // 4) * 4, dtype=np.uint8)
+  padded_sequence[:len(sequence)] = sequence
+  padded_sequence = padded_sequence.reshape(-1, 4)
+  return ((padded_sequence[:, 0] << 6) | (padded_sequence[:, 1] << 4)
+          | (padded_sequence[:, 2] << 2) | padded_sequence[:, 3])
+
+
+def unpack_sequence(packed_sequence, sequence_length):
+  shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+  sequence = (packed_sequence[:, None] >> shifts) & 3
+  return sequence.reshape(-1)[:sequence_length].astype(np.uint8)
+
+
+sequence_cache = SequenceCache(directory=os.environ.get('VLMC_SEQUENCE_CACHE'))
@@ -0,0 +1,74 @@
+import math
+import pickle
+
+import numpy as np
+
+from vlmc import VLMC, log_likelihoods
+
+
+def reference_log_likelihood(vlmc, sequence, nbr_skipped_letters=0):
+  """
+    The character by character scoring of the original implementation.
+  """
+  log_likelihood = 0.0
+  for i in range(nbr_skipped_letters, len(sequence)):
+    history = sequence[max(i - vlmc.order, 0):i]
+    context = next(history[j:] for j in range(len(history) + 1) if history[j:] in vlmc.tree)
+    probability = vlmc.tree[context].get(sequence[i], 0.0)
+    log_likelihood += math.log(probability) if probability > 0 else -1000
+  return log_likelihood
+
+
+def test_log_likelihood_matches_reference(vlmcs):
+  for vlmc in vlmcs:
+    sequence = vlmcs[0].generate_sequence_from(300, "", np.random.default_rng(2))
+    assert np.isclose(vlmc.log_likelihood(sequence), reference_log_likelihood(vlmc, sequence))
+    assert np.isclose(vlmc.log_likelihood_ignore_initial_bias(sequence),
+                      reference_log_likelihood(vlmc, sequence, vlmc.order))
+
+
+def test_characters_outside_the_alphabet_are_impossible(vlmcs):
+  sequence = "ACGTNACGGTANNCATG"
+  for vlmc in vlmcs:
+    assert np.isclose(vlmc.log_likelihood(sequence), reference_log_likelihood(vlmc, sequence))
+    assert vlmc.log_likelihood(sequence) < -3 * 1000 + 1
+    assert vlmc.likelihood(sequence) == 0.0
+
+
+def test_log_likelihoods_scores_every_vlmc(vlmcs):
+  sequence = vlmcs[1].generate_sequence_from(200, "", np.random.default_rng(3)) + "N" + "ACGT"
+  assert np.allclose(log_likelihoods(vlmcs, sequence),
+                     [vlmc.log_likelihood(sequence) for vlmc in vlmcs])
+  assert np.allclose(log_likelihoods(vlmcs, sequence, ignore_initial_bias=True),
+                     [vlmc.log_likelihood_ignore_initial_bias(sequence) for vlmc in vlmcs])
+
+
+def test_generated_sequences_only_use_possible_transitions(vlmcs):
+  for vlmc in vlmcs:
+    sequence = vlmc.generate_sequence_from(2000, "", np.random.default_rng(4))
+    assert len(sequence) == 2000
+    context_ids = vlmc.context_ids(sequence)
+    characters = ["ACGT".index(char_) for char_ in sequence]
+    assert np.all(vlmc.transition_matrix[context_ids, characters] > 0)
+
+
+def test_chunks_continue_the_sequence(vlmcs):
+  for vlmc in vlmcs:
+    whole = vlmc.generate_encoded_sequence(103, "AC", np.random.default_rng(5))
+    for chunk_size in [1, 2, vlmc.order, 50]:
+      chunks = vlmc.generate_sequence_chunks(103, max(chunk_size, 1), "AC", np.random.default_rng(5))
+      assert np.array_equal(np.concatenate(list(chunks)), whole)
+
+
+def test_sampled_sequences_are_seeded_per_model(vlmcs):
+  left, right = vlmcs[0], VLMC(dict(vlmcs[0].tree), "copy", {})
+  sequence = left.sampled_sequence(500, 50)
+  assert np.array_equal(sequence, right.sampled_sequence(500, 50))
+  assert np.array_equal(sequence, pickle.loads(pickle.dumps(left)).sampled_sequence(500, 50))
+  assert left.sequence_seed() != vlmcs[1].sequence_seed()
+
+  left.reset_sequence()
+  assert not np.array_equal(sequence, left.sampled_sequence(500, 50))
+  assert np.array_equal(left.sampled_sequence(500, 50),
+                        pickle.loads(pickle.dumps(left)).sampled_sequence(500, 50))
+  assert np.array_equal(sequence, left.sampled_sequence(500, 50, right.sequence_seed()))
@@ -2,24 +2,150 @@ import math
 import json
 from queue import Queue
 import os
-from random import choices
+import hashlib
+import numpy as np
+cimport numpy as np
+
+from sequence_cache import sequence_cache
+from context_automaton import ContextAutomaton
+
+FLOATTYPE = np.float64
+ctypedef np.float64_t FLOATTYPE_t
+INTTYPE = np.intc
+
+ALPHABET = ['A', 'C', 'G', 'T']
+DEF ALPHABET_SIZE = 4
+# log-probability used for impossible transitions, corresponds to prob == e^-1000
+DEF IMPOSSIBLE_LOG_PROBABILITY = -1000
+
+# Characters are encoded by their index in the alphabet, everything else maps to ALPHABET_SIZE.
+_ENCODING = np.full(256, ALPHABET_SIZE, dtype=np.uint8)
+for i, char_ in enumerate(ALPHABET):
+  _ENCODING[ord(char_)] = i
+_DECODING = np.frombuffer(''.join(ALPHABET + ['N']).encode('ascii'), dtype=np.uint8)
+
+
+cpdef np.ndarray encode_sequence(sequence):
+  """
+    Encodes a sequence of characters as an uint8 array of alphabet indices.
+    Already encoded sequences are returned as is.
+  """
+  if isinstance(sequence, np.ndarray):
+    return sequence
+  return _ENCODING[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+
+
+cpdef str decode_sequence(encoded_sequence):
+  return _DECODING[encoded_sequence].tobytes().decode('ascii')
+
+
+cpdef np.ndarray log_likelihoods(vlmcs, sequence, ignore_initial_bias=False):
+  """
+    Scores one sequence against every vlmc.  The sequence is encoded, and checked
+    against the alphabet, once for all of them.
+  """
+  cdef np.ndarray encoded_sequence = encode_sequence(sequence)
+  cdef np.ndarray in_alphabet = encoded_sequence < ALPHABET_SIZE
+  cdef np.ndarray scores = np.empty(len(vlmcs), dtype=FLOATTYPE)
+  cdef VLMC vlmc
+  cdef Py_ssize_t i
+  for i, vlmc in enumerate(vlmcs):
+    scores[i] = vlmc._transition_values(encoded_sequence, in_alphabet, vlmc.log_transition_matrix,
+                                        IMPOSSIBLE_LOG_PROBABILITY)[vlmc.order if ignore_initial_bias else 0:].sum()
+  return scores
 
 
 cdef class VLMC(object):
   cdef public dict tree
   cdef public str name
   cdef public int order
-  cdef public str sequence
   cdef public list alphabet
   cdef dict occurrence_probabilites
+  cdef str _fingerprint
+  cdef object _sequence_seed
+  cdef np.ndarray _stationary_context_distribution
+  cdef np.ndarray _context_occurrence_probabilities
+  # Compiled representation of the tree, built once in _compile_tree.
+  cdef public list contexts
+  cdef public dict context_index
+  cdef public np.ndarray transition_matrix
+  cdef public np.ndarray log_transition_matrix
+  cdef double[:, ::1] cumulative_transitions
+  cdef int[:, ::1] trie_children
+  cdef int[::1] trie_context
+  cdef int[::1] trie_own_context
 
   def __init__(self, tree, name, occurrence_probability):
     self.tree = tree
     self.name = name
     self.order = self._calculate_order(tree)
-    self.sequence = ""
-    self.alphabet = ['A', 'C', 'G', 'T']
+    self.alphabet = list(ALPHABET)
     self.occurrence_probabilites = occurrence_probability
+    self._compile_tree()
+
+  cdef void _compile_tree(self):
+    """
+      Gives every context an integer id, with its transition probabilities as a row
+      of transition_matrix.  The contexts are also inserted into a trie, read from the
+      last character and backwards, so that the context of a sequence is found by
+      walking at most /order/ nodes without slicing strings or probing the dict.
+    """
+    # Sorted by length so that the root context "" gets id 0
+    self.contexts = sorted(self.tree.keys(), key=lambda c: (len(c), c))
+    self.context_index = {context: i for i, context in enumerate(self.contexts)}
+
+    self.transition_matrix = np.array(
+        [[self.tree[context].get(char_, 0.0) for char_ in self.alphabet] for context in self.contexts],
+        dtype=FLOATTYPE).reshape(len(self.contexts), ALPHABET_SIZE)
+    with np.errstate(divide='ignore'):
+      self.log_transition_matrix = np.where(self.transition_matrix > 0,
+                                            np.log(self.transition_matrix),
+                                            IMPOSSIBLE_LOG_PROBABILITY)
+    self.cumulative_transitions = np.cumsum(self.transition_matrix, axis=1)
+
+    char_index = {char_: i for i, char_ in enumerate(self.alphabet)}
+    children = [[-1] * ALPHABET_SIZE]
+    parents = [-1]
+    node_context = [-1]
+    for context_id, context in enumerate(self.contexts):
+      if any(char_ not in char_index for char_ in context):
+        # Can never match an encoded sequence
+        continue
+      node = 0
+      for char_ in reversed(context):
+        character = char_index[char_]
+        if children[node][character] == -1:
+          children[node][character] = len(children)
+          children.append([-1] * ALPHABET_SIZE)
+          parents.append(node)
+          node_context.append(-1)
+        node = children[node][character]
+      node_context[node] = context_id
+
+    self.trie_own_context = np.array(node_context, dtype=INTTYPE)
+    # Nodes which aren't contexts themselves resolve to the closest context above them,
+    # parents are always created before their children.
+    for node in range(1, len(children)):
+      if node_context[node] == -1:
+        node_context[node] = node_context[parents[node]]
+
+    self.trie_children = np.array(children, dtype=INTTYPE)
+    self.trie_context = np.array(node_context, dtype=INTTYPE)
+
+  cdef int _context_id(self, const unsigned char[::1] sequence, Py_ssize_t end):
+    """
+      Id of the longest context which is a suffix of sequence[:end], or -1 if there is none.
+    """
+    cdef int node = 0
+    cdef int child
+    cdef Py_ssize_t i = end - 1
+    while i >= 0 and sequence[i] < ALPHABET_SIZE:
+      child = self.trie_children[node, sequence[i]]
+      if child < 0:
+        break
+      node = child
+      i -= 1
+    return self.trie_context[node]
 
   def __str__(self):
     return self.name
@@ -30,6 +156,22 @@ cdef class VLMC(object):
   def __eq__(self, other):
     return other is not None and self.name == other.name
 
+  def __reduce__(self):
+    # The compiled tree is rebuilt rather than pickled
+    return (VLMC, (self.tree, self.name, self.occurrence_probabilites), self._sequence_seed)
+
+  def __setstate__(self, sequence_seed):
+    self._sequence_seed = sequence_seed
+
+  cpdef str fingerprint(self):
+    """
+      Hash of the tree, identifies the model independently of its name.
+    """
+    if self._fingerprint is None:
+      tree_json = json.dumps(self.tree, sort_keys=True)
+      self._fingerprint = hashlib.sha1(tree_json.encode('utf-8')).hexdigest()
+    return self._fingerprint
+
   @classmethod
   def from_json(cls, s, name=""):
     """
@@ -84,61 +226,104 @@ cdef class VLMC(object):
   cpdef double log_likelihood(self, sequence):
     return self._log_likelihood(sequence, 0)
 
-  cdef double _log_likelihood(self, sequence, nbr_skipped_letters):
+  cdef double _log_likelihood(self, sequence, nbr_skipped_letters) except? -1:
     # assume we already looked at the first nbr_skipped_letters
-    cdef str sequence_so_far = sequence[:nbr_skipped_letters]
-    cdef str sequence_left = sequence[nbr_skipped_letters:]
-    cdef double log_likelihood = 0.0
-    for s in sequence_left:
-      prob = self._probability_of_char_given_sequence(s, sequence_so_far[-self.order:])
-      if prob == 0:
-        # means the vlmc could not possibly have generated the sequence
-        # corresponds to prob == e^-1000
-        log_likelihood -= 1000
-      else:
-        log_likelihood += math.log(prob)
-      sequence_so_far += s
-    return log_likelihood
+    cdef np.ndarray encoded_sequence = encode_sequence(sequence)
+    return self._transition_values(encoded_sequence, encoded_sequence < ALPHABET_SIZE,
+                                   self.log_transition_matrix,
+                                   IMPOSSIBLE_LOG_PROBABILITY)[nbr_skipped_letters:].sum()
 
   cpdef double likelihood(self, sequence):
     return self._likelihood(sequence, 0)
   
-  cdef double _likelihood(self, sequence, nbr_skipped_letters):
+  cdef double _likelihood(self, sequence, nbr_skipped_letters) except? -1:
     # assume we already looked at the first nbr_skipped_letters
-    cdef str sequence_so_far = sequence[:nbr_skipped_letters]
-    cdef str sequence_left = sequence[nbr_skipped_letters:]
-    cdef double likelihood = 1.0
-    cdef double prob = -1
-    for s in sequence_left:
-      prob = self._probability_of_char_given_sequence(s, sequence_so_far[-self.order:])
-      if prob == 0:
-        return 0.0
-      else:
-        likelihood *= prob
-      sequence_so_far += s
-    return likelihood
-  
-
-  cdef double _probability_of_char_given_sequence(self, character, seq):
-    if len(seq) == self.order and seq in self.tree:
-      # early return if possible. will be often if the model is a full Markov chain
-      return self.tree[seq][character]
-
-    cdef str context = self.get_context(seq)
-    return self.tree[context][character]
+    cdef np.ndarray encoded_sequence = encode_sequence(sequence)
+    return self._transition_values(encoded_sequence, encoded_sequence < ALPHABET_SIZE,
+                                   self.transition_matrix, 0.0)[nbr_skipped_letters:].prod()
 
+  cpdef np.ndarray context_ids(self, sequence):
+    """
+      The id of the context used to predict every position of the sequence,
+      -1 where there is no matching context.
+    """
+    cdef const unsigned char[::1] encoded_sequence = encode_sequence(sequence)
+    cdef np.ndarray[np.intp_t, ndim=1] context_ids = np.empty(encoded_sequence.shape[0], dtype=np.intp)
+    cdef Py_ssize_t i
+    for i in range(encoded_sequence.shape[0]):
+      context_ids[i] = self._context_id(encoded_sequence, i)
+    return context_ids
+
+  cpdef np.ndarray count_transitions(self, sequence, np.ndarray counts=None, Py_ssize_t start=0):
+    """
+      Counts the characters that follow every context in the sequence, as a
+      [contexts, alphabet] array.  Every context which is a suffix of the history counts,
+      not only the longest one, as in get_all_contexts.  The characters before start are
+      only history, so a long sequence can be counted in chunks which overlap by /order/
+      characters, adding to the same counts.
+    """
+    if counts is None:
+      counts = np.zeros([len(self.contexts), ALPHABET_SIZE], dtype=np.int64)
+    cdef np.int64_t[:, ::1] counts_view = counts
+    cdef const unsigned char[::1] encoded_sequence = encode_sequence(sequence)
+    cdef unsigned char character
+    cdef int node, context_id
+    cdef Py_ssize_t i, j
+    for i in range(start, encoded_sequence.shape[0]):
+      character = encoded_sequence[i]
+      if character >= ALPHABET_SIZE:
+        continue
+      node = 0
+      j = i
+      while True:
+        context_id = self.trie_own_context[node]
+        if context_id >= 0:
+          counts_view[context_id, character] += 1
+        j -= 1
+        if j < 0 or encoded_sequence[j] >= ALPHABET_SIZE:
+          break
+        node = self.trie_children[node, encoded_sequence[j]]
+        if node < 0:
+          break
+    return counts
+
+  cdef np.ndarray _transition_values(self, np.ndarray encoded_sequence, np.ndarray in_alphabet,
+                                     np.ndarray matrix, double impossible_value):
+    """
+      matrix[context, character] at every position of the sequence.  A character outside
+      the alphabet can never be generated, so it gets impossible_value.
+    """
+    cdef np.ndarray context_ids = self.context_ids(encoded_sequence)
+    if np.any(context_ids < 0):
+      raise RuntimeError("get_context vlmc.pyx")
+    cdef np.ndarray values = np.full(encoded_sequence.shape[0], impossible_value, dtype=FLOATTYPE)
+    values[in_alphabet] = matrix[context_ids[in_alphabet], encoded_sequence[in_alphabet]]
+    return values
 
   cpdef str get_context(self, sequence):
-    if len(sequence) <= self.order and sequence in self.tree:
-      return sequence
-    for i in range(self.order+1):
-      if not i == self.order:
-        maybe_context = sequence[-(self.order-i):]
-      else:
-        maybe_context = ""
-      if maybe_context in self.tree:
-        return maybe_context
-    raise RuntimeError("get_context vlmc.pyx")
+    # Only the last /order/ characters can be part of the context
+    if len(sequence) > self.order:
+      sequence = sequence[len(sequence) - self.order:]
+    cdef const unsigned char[::1] encoded_sequence = encode_sequence(sequence)
+    cdef int context_id = self._context_id(encoded_sequence, encoded_sequence.shape[0])
+    if context_id < 0:
+      raise RuntimeError("get_context vlmc.pyx")
+    return self.contexts[context_id]
+
+  cpdef np.ndarray get_context_ids(self, list sequences):
+    """
+      Id of the context of every sequence, as get_context.  The sequences are encoded in
+      one go, separated by a character outside the alphabet which stops the trie walk.
+    """
+    cdef const unsigned char[::1] encoded_sequences = encode_sequence('N'.join(sequences))
+    cdef np.ndarray[np.intp_t, ndim=1] ends = np.cumsum([len(s) + 1 for s in sequences], dtype=np.intp) - 1
+    cdef np.ndarray[np.intp_t, ndim=1] context_ids = np.empty(len(sequences), dtype=np.intp)
+    cdef Py_ssize_t i
+    for i in range(len(sequences)):
+      context_ids[i] = self._context_id(encoded_sequences, ends[i])
+    if np.any(context_ids < 0):
+      raise RuntimeError("get_context vlmc.pyx")
+    return context_ids
 
   cpdef list get_all_contexts(self, sequence):
     possible_contexts = []
@@ -153,32 +338,115 @@ cdef class VLMC(object):
 
     return possible_contexts
 
-  cpdef str generate_sequence(self, sequence_length, pre_sample_length):
-    if len(self.sequence) == sequence_length:
-      return self.sequence
-
-    total_length = sequence_length + pre_sample_length
-    cdef str generated_sequence = self.generate_sequence_from(total_length, "")
-    self.sequence = generated_sequence[-sequence_length:]
-    return generated_sequence[-sequence_length:]
-
-  cpdef str generate_sequence_from(self, sequence_length, context):
-    generated_sequence = context
-    for i in range(sequence_length):
-      # only send the last /order/ number of characters to generate next letter
-      next_letter = self._generate_next_letter(generated_sequence[-self.order:])
-      generated_sequence += next_letter
+  cpdef str generate_sequence(self, sequence_length, pre_sample_length, seed=None):
+    return decode_sequence(self.sampled_sequence(sequence_length, pre_sample_length, seed))
+
+  cpdef np.ndarray sampled_sequence(self, sequence_length, pre_sample_length, seed=None):
+    """
+      The encoded sequence of length sequence_length generated with the given seed, after
+      discarding the first pre_sample_length characters.  Sequences are shared through
+      the sequence cache, so the same arguments always give the same (read-only) sequence.
+      Without a seed, the sequence seed of the model is used.
+    """
+    if seed is None:
+      seed = self.sequence_seed()
+    return sequence_cache.get(self, sequence_length, pre_sample_length, seed)
+
+  cpdef object sequence_seed(self):
+    """
+      The default seed of the generated sequences.  It is derived from the fingerprint,
+      so the sequences are reproducible but differ between models, until reset_sequence.
+    """
+    if self._sequence_seed is None:
+      self._sequence_seed = int(self.fingerprint()[:16], 16)
+    return self._sequence_seed
+
+  cpdef str generate_sequence_from(self, sequence_length, context, rng=None):
+    return decode_sequence(self.generate_encoded_sequence(sequence_length, context, rng))
+
+  cpdef np.ndarray generate_encoded_sequence(self, sequence_length, context="", rng=None):
+    """
+      Generates an encoded sequence of length sequence_length, continuing from context.
+      The random numbers are drawn in bulk from the numpy Generator rng.
+    """
+    if rng is None:
+      rng = np.random.default_rng()
+    cdef np.ndarray encoded_context = encode_sequence(context)
+    cdef Py_ssize_t context_length = encoded_context.shape[0]
+    cdef np.ndarray generated_sequence = np.empty(context_length + sequence_length, dtype=np.uint8)
+    generated_sequence[:context_length] = encoded_context
+
+    self._fill_sequence(generated_sequence, context_length, rng.random(sequence_length))
     # return the suffix with length sequence_length
-    return generated_sequence[len(context):]
+    return generated_sequence[context_length:]
 
-  cdef str _generate_next_letter(self, current_sequence):
-    probabilities = map(lambda char_: self._probability_of_char_given_sequence(
-        char_, current_sequence), self.alphabet)
-    return choices(self.alphabet, weights=probabilities)[0]
+  def generate_sequence_chunks(self, sequence_length, chunk_size, context="", rng=None):
+    """
+      Generates an encoded sequence of length sequence_length in chunks of chunk_size,
+      every chunk continues from the last /order/ characters generated so far, which
+      may span several chunks if they are shorter than the order.
+    """
+    if rng is None:
+      rng = np.random.default_rng()
+    cdef np.ndarray chunk
+    cdef np.ndarray history = encode_sequence(context)
+    cdef Py_ssize_t chunk_length
+    for start in range(0, sequence_length, chunk_size):
+      chunk_length = min(chunk_size, sequence_length - start)
+      chunk = self.generate_encoded_sequence(chunk_length, history, rng)
+      history = np.concatenate([history, chunk])[max(history.shape[0] + chunk_length - self.order, 0):]
+      yield chunk
+
+  cdef int _fill_sequence(self, unsigned char[::1] sequence, Py_ssize_t start,
+                          const double[::1] uniforms) except -1:
+    """
+      Draws sequence[start:] one character at a time, by finding where the uniform
+      number falls in the cumulative distribution of the current context.
+    """
+    cdef int context_id
+    cdef unsigned char character
+    cdef double u
+    cdef Py_ssize_t i
+    for i in range(start, sequence.shape[0]):
+      context_id = self._context_id(sequence, i)
+      if context_id < 0:
+        raise RuntimeError("get_context vlmc.pyx")
+      # scale by the total to not depend on the probabilities summing to exactly one
+      u = uniforms[i - start] * self.cumulative_transitions[context_id, ALPHABET_SIZE - 1]
+      character = 0
+      while character < ALPHABET_SIZE - 1 and u >= self.cumulative_transitions[context_id, character]:
+        character += 1
+      sequence[i] = character
+    return 0
 
   def _calculate_order(self, tree):
     return max(map(lambda k: len(k), tree.keys()))
 
+  cpdef np.ndarray stationary_context_distribution(self):
+    """
+      The long run probability of every context (by id), from the stationary distribution
+      of the model over the substrings of its contexts.  Calculated once per model.
+    """
+    if self._stationary_context_distribution is None:
+      automaton = ContextAutomaton([self])
+      self._stationary_context_distribution = np.bincount(
+          automaton.context_ids(self), weights=automaton.stationary_distribution(self),
+          minlength=len(self.contexts))
+    return self._stationary_context_distribution
+
+  cpdef dict context_distribution(self):
+    """
+      The exact version of estimated_context_distribution.
+    """
+    return {self.contexts[i]: float(probability)
+            for i, probability in enumerate(self.stationary_context_distribution()) if probability > 0}
+
+  cpdef np.ndarray stationary_character_distribution(self):
+    """
+      The long run probability of each character of the alphabet.
+    """
+    return self.stationary_context_distribution() @ self.transition_matrix
+
   cpdef dict estimated_context_distribution(self, sequence_length):
     sequence = self.generate_sequence(sequence_length, 500)
     context_counters = self._count_state_occourances(sequence)
@@ -192,21 +460,22 @@ cdef class VLMC(object):
 
 
   cdef dict _count_state_occourances(self, sequence):
-    state_count = {}
+    cdef const unsigned char[::1] encoded_sequence = encode_sequence(sequence)
+    cdef np.ndarray[np.intp_t, ndim=1] context_ids = np.empty(
+        max(encoded_sequence.shape[0] - self.order, 0), dtype=np.intp)
+    cdef Py_ssize_t i
+    for i in range(context_ids.shape[0]):
+      context_ids[i] = self._context_id(encoded_sequence, i + self.order)
 
-    for i in range(len(sequence) - self.order):
-      current_sequence = sequence[i:i + self.order]
-      matching_state = self.get_context(current_sequence)
-      if matching_state in state_count:
-        state_count[matching_state] += 1
-      else:
-        # give initial value of 1
-        state_count[matching_state] = 1
-
-    return state_count
+    state_count = np.bincount(context_ids, minlength=len(self.contexts))
+    return {self.contexts[i]: int(count) for i, count in enumerate(state_count) if count > 0}
 
   cpdef void reset_sequence(self):
-    self.sequence = ""
+    """
+      Forgets the generated sequences, and draws a fresh sequence seed for the next ones.
+    """
+    sequence_cache.clear(self)
+    self._sequence_seed = int(np.random.SeedSequence().entropy)
 
 
   cpdef double occurrence_probability(self, state):
@@ -215,6 +484,15 @@ cdef class VLMC(object):
 
     return self.occurrence_probabilites[state]
 
+  cpdef np.ndarray context_occurrence_probabilities(self):
+    """
+      The occurrence probability of every context, in the order of contexts, built once.
+    """
+    if self._context_occurrence_probabilities is None:
+      self._context_occurrence_probabilities = np.array(
+          [self.occurrence_probability(context) for context in self.contexts], dtype=FLOATTYPE)
+    return self._context_occurrence_probabilities
+
 
 if __name__ == "__main__":
   s = '{"":{"A":0.5,"B":0.5},"A":{"B":0.5,"A":0.5},"B":{"A":0.5,"B":0.5},"BA":{"A":0.5,"B":0.5},"AA":{"A":0.5,"B":0.5}}'